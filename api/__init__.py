@@ -1,22 +1,31 @@
+import click
 from flask import Flask
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 from flask_restx import Api
 from werkzeug.exceptions import NotFound
 
-from .database import db
-from .models.users import Admin
+from .blocklist import TokenBlocklist
+from .database import apply_sqlite_pragmas, db
+from .instrumentation import QueryInstrumentation
+from .metrics import MetricsRegistry
+from .passwords import PasswordHasher
+from .throttle import Throttle
+from .models.users import Admin, UserCache
 from .models.courses import Course, enrollment
 from .models.grades import Grade
+from .models.identities import Identity
+from .models.scales import GradingScale, GradingScaleCache
+from .models.sequences import SchoolIdAllocator, SchoolIdSequence
 from .models.students import Student
 from .models.teachers import Teacher
+from .models.tokens import RevokedToken
 from .resources.auth import auth_ns
 from .resources.admin import admin_ns
 from .resources.courses import course_ns
 from .resources.grades import grade_ns
 from .resources.students import student_ns
 from .resources.teachers import teacher_ns
-from .util import BLOCKLIST
 
 
 def create_app(stage):
@@ -28,8 +37,47 @@ def create_app(stage):
     app.logger.info("Starting Student Management System")
 
     db.init_app(app)
+    app.extensions["user_cache"] = UserCache(app.config.get("USER_CACHE_TTL", 0))
+    app.extensions["grading_scales"] = GradingScaleCache(
+        app.config.get("GRADING_SCALE_CACHE_TTL", 60)
+    )
+    app.extensions["school_id_allocator"] = SchoolIdAllocator(
+        app.config.get("SCHOOL_ID_BLOCK_SIZE", 100)
+    )
+    app.extensions["token_blocklist"] = TokenBlocklist(
+        app,
+        capacity=app.config.get("TOKEN_BLOCKLIST_CAPACITY", 10000),
+        sync_interval=app.config.get("TOKEN_BLOCKLIST_SYNC_INTERVAL", 5),
+        sweep_interval=app.config.get("TOKEN_BLOCKLIST_SWEEP_INTERVAL", 3600),
+    )
+    app.extensions["password_hasher"] = PasswordHasher(
+        app.config.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256"),
+        max_workers=app.config.get("PASSWORD_HASH_WORKERS"),
+        max_pending=app.config.get("PASSWORD_HASH_MAX_PENDING", 64),
+    )
+    app.extensions["login_identity_throttle"] = Throttle(
+        app.config.get("LOGIN_IDENTITY_RATE", 0), app.config.get("LOGIN_IDENTITY_BURST", 5)
+    )
+    app.extensions["login_ip_throttle"] = Throttle(
+        app.config.get("LOGIN_IP_RATE", 0), app.config.get("LOGIN_IP_BURST", 50)
+    )
+    app.extensions["query_instrumentation"] = QueryInstrumentation(
+        app,
+        slow_ms=app.config.get("QUERY_SLOW_MS", 100),
+        sample_rate=app.config.get("QUERY_SAMPLE_RATE", 0.0),
+        n_plus_one_threshold=app.config.get("QUERY_N_PLUS_ONE_THRESHOLD", 10),
+    )
+    app.extensions["metrics"] = MetricsRegistry(
+        app,
+        directory=app.config.get("METRICS_DIRECTORY"),
+        flush_interval=app.config.get("METRICS_FLUSH_INTERVAL", 5),
+        token=app.config.get("METRICS_TOKEN"),
+    )
     with app.app_context():
+        app.extensions["query_instrumentation"].instrument(db.engine)
+        apply_sqlite_pragmas(db.engine, app.config.get("SQLITE_PRAGMAS"))
         db.create_all()
+    app.extensions["token_blocklist"].start_sweeper()
 
     migrate = Migrate(app, db, "migrations")
     jwt = JWTManager(app)
@@ -66,15 +114,31 @@ def create_app(stage):
 
     @jwt.token_in_blocklist_loader
     def check_if_token_in_blocklist(jwt_header, jwt_payload):
-        return jwt_payload["jti"] in BLOCKLIST
+        return app.extensions["token_blocklist"].is_revoked(jwt_payload["jti"])
 
     @jwt.user_lookup_loader
     def user_lookup_callback(_jwt_header, jwt_data):
         identity = jwt_data["sub"]
         role = jwt_data["role"]
-        if role == "ADMIN": return Admin.query.get(identity)
-        elif role == "STAFF": return Teacher.query.get(identity)
-        else: return Student.query.get(identity)
+        user_cache = app.extensions["user_cache"]
+        if role == "ADMIN": return user_cache.get(Admin, identity)
+        elif role == "STAFF": return user_cache.get(Teacher, identity)
+        else: return user_cache.get(Student, identity)
+
+    @app.cli.command("reconcile-gpa")
+    @click.option("--dry-run", is_flag=True, help="Report drift without fixing it.")
+    def reconcile_gpa(dry_run):
+        """
+        Recompute every student's grade totals and report drifted GPAs
+        """
+        drift = Student.reconcile_grade_totals(fix=not dry_run)
+        for item in drift:
+            click.echo(
+                f"Student {item['student_id']}: stored {item['stored']}, "
+                f"expected {item['expected']}"
+            )
+        action = "Found" if dry_run else "Fixed"
+        click.echo(f"{action} {len(drift)} student(s) with drifted grade totals")
 
     @app.shell_context_processor
     def make_shell_context():
@@ -85,7 +149,11 @@ def create_app(stage):
             "Teacher": Teacher,
             "Course": Course,
             "Grade": Grade,
-            "enrollment": enrollment
+            "GradingScale": GradingScale,
+            "enrollment": enrollment,
+            "SchoolIdSequence": SchoolIdSequence,
+            "RevokedToken": RevokedToken,
+            "Identity": Identity,
         }
 
     return app
@@ -0,0 +1,129 @@
+import hashlib
+import math
+import threading
+import time
+
+from sqlalchemy import delete, exists, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from .database import db
+from .models.tokens import RevokedToken
+
+
+class BloomFilter:
+    """
+    Fixed size Bloom filter over strings. It never gives false negatives, so a
+    jti it does not contain has certainly not been revoked.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.num_hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class TokenBlocklist:
+    """
+    Revoked token store shared by every worker through the `revoked_token` table.
+
+    An in-process Bloom filter answers the common "not revoked" case without
+    touching the database. It is topped up with tokens revoked by other workers
+    at most every `sync_interval` seconds, and a background sweep deletes
+    expired tokens and rebuilds the filter every `sweep_interval` seconds.
+    """
+
+    def __init__(self, app, capacity=10000, sync_interval=5, sweep_interval=3600):
+        self.app = app
+        self.capacity = capacity
+        self.sync_interval = sync_interval
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._filter = BloomFilter(capacity)
+        self._last_id = 0
+        self._last_sync = None
+        self._sweeper = None
+
+    def revoke(self, jti, expires_at):
+        try:
+            db.session.execute(insert(RevokedToken).values(jti=jti, expires_at=expires_at))
+            db.session.commit()
+        # Already revoked
+        except IntegrityError:
+            db.session.rollback()
+        with self._lock:
+            self._filter.add(jti)
+
+    def is_revoked(self, jti):
+        if self._last_sync is None or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+        if jti not in self._filter:
+            return False
+        return db.session.execute(select(exists().where(RevokedToken.jti == jti))).scalar()
+
+    def sync(self):
+        """
+        Add the tokens revoked since the last sync, by any worker, to the filter
+        """
+        with self._lock:
+            rows = db.session.execute(
+                select(RevokedToken.id, RevokedToken.jti)
+                .where(RevokedToken.id > self._last_id)
+                .order_by(RevokedToken.id)
+            ).all()
+            for row_id, jti in rows:
+                self._filter.add(jti)
+                self._last_id = row_id
+            self._last_sync = time.monotonic()
+
+    def prune(self):
+        """
+        Delete expired tokens and rebuild the filter from the ones left.
+        Returns the number of tokens deleted.
+        """
+        result = db.session.execute(
+            delete(RevokedToken).where(RevokedToken.expires_at < int(time.time()))
+        )
+        db.session.commit()
+
+        # Fill the new filter before swapping it in, so no revoked token is missed meanwhile
+        with self._lock:
+            rows = db.session.execute(
+                select(RevokedToken.id, RevokedToken.jti).order_by(RevokedToken.id)
+            ).all()
+            new_filter = BloomFilter(max(self.capacity, 2 * len(rows)))
+            for row_id, jti in rows:
+                new_filter.add(jti)
+            self._filter = new_filter
+            self._last_id = rows[-1].id if rows else self._last_id
+            self._last_sync = time.monotonic()
+        return result.rowcount
+
+    def start_sweeper(self):
+        if self.sweep_interval <= 0 or self._sweeper is not None:
+            return
+        self._sweeper = threading.Thread(target=self._sweep, name="token-blocklist-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                with self.app.app_context():
+                    pruned = self.prune()
+                self.app.logger.info(f"Pruned {pruned} expired revoked tokens")
+            except Exception as e:
+                self.app.logger.error(f"Could not prune revoked tokens: {e}")
@@ -0,0 +1,99 @@
+import random
+import re
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+
+# Lists of bound parameters, e.g. the expanded values of an IN clause
+PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    """
+    Normalize a statement so the same query with a different number of
+    IN values or different formatting counts as one shape
+    """
+    return PLACEHOLDER_LIST.sub("?, ...", WHITESPACE.sub(" ", statement).strip())
+
+
+class RequestQueries:
+    """
+    The statements run while handling one request
+    """
+
+    __slots__ = ("count", "duration", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def repeated(self, threshold):
+        """
+        Statement shapes run more than `threshold` times, most repeated first
+        """
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+class QueryInstrumentation:
+    """
+    Counts and times every statement an engine runs through its cursor
+    events, instead of echoing them all.
+
+    Each request gets a `RequestQueries` in `g.queries` and a summary line in
+    the log when it finishes, with a warning for statement shapes repeated
+    more than `n_plus_one_threshold` times (a likely N+1). Single statements
+    are only logged when they take `slow_ms` or longer, or for a random
+    `sample_rate` fraction of them.
+    """
+
+    def __init__(self, app, slow_ms=100, sample_rate=0.0, n_plus_one_threshold=10):
+        self.logger = app.logger
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def instrument(self, engine):
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context._query_started
+        queries = g.get("queries") if has_request_context() else None
+        if queries is not None:
+            queries.count += 1
+            queries.duration += duration
+            queries.shapes[statement_shape(statement)] += 1
+
+        duration_ms = duration * 1000
+        if self.slow_ms and duration_ms >= self.slow_ms:
+            self.logger.warning(f"Slow query ({duration_ms:.1f} ms): {statement_shape(statement)}")
+        elif self.sample_rate and random.random() < self.sample_rate:
+            self.logger.info(f"Sampled query ({duration_ms:.1f} ms): {statement_shape(statement)}")
+
+    def start_request(self):
+        g.queries = RequestQueries()
+
+    def finish_request(self, response):
+        queries = g.get("queries")
+        if queries is None:
+            return response
+
+        endpoint = f"{request.method} {request.path}"
+        for shape, count in queries.repeated(self.n_plus_one_threshold):
+            self.logger.warning(f"Possible N+1 query in {endpoint}, run {count} times: {shape}")
+        self.logger.info(
+            f"{endpoint} {response.status_code}: "
+            f"{queries.count} queries in {queries.duration * 1000:.1f} ms"
+        )
+        return response
@@ -0,0 +1,232 @@
+import atexit
+import bisect
+import hmac
+import json
+import os
+import re
+import threading
+import time
+import weakref
+from functools import lru_cache
+
+from flask import abort, g, request
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Offsets of the totals kept for each (endpoint, method, status) series,
+# followed by one non-cumulative count per latency bucket and +Inf
+COUNT, DURATION, QUERIES, DB_TIME, BUCKETS = range(5)
+
+
+@lru_cache(maxsize=256)
+def endpoint_label(rule):
+    """
+    The URL rule a request matched, e.g. `/api/v0/grade/<int:course_id>/bulk`,
+    so the label has one value per route rather than per URL
+    """
+    return re.sub(r"/+", "/", rule)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def merge_totals(totals, series):
+    """
+    Add the values of every (key, values) pair in `series` into `totals`
+    """
+    for key, values in series:
+        merged = totals.get(key)
+        if merged is None:
+            totals[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                merged[i] += value
+
+
+class MetricsRegistry:
+    """
+    Request count, latency histogram, SQL query count and database time of
+    every endpoint, method and status code, served as Prometheus text at
+    `/metrics`.
+
+    Every thread records into its own shard, so recording never takes a
+    lock; shards are only merged when the metrics are read, and the shard of
+    a thread that has ended is folded into the retired totals. With a
+    `directory`, each worker process also writes its totals to a file there
+    at most every `flush_interval` seconds, and `/metrics` adds up the files
+    of every worker.
+
+    `/metrics` needs `Authorization: Bearer <token>`, and is not served at
+    all without a `token`.
+    """
+
+    def __init__(self, app, buckets=DEFAULT_BUCKETS, directory=None, flush_interval=5, token=None):
+        self.logger = app.logger
+        self.buckets = tuple(sorted(buckets))
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.token = token
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._shards_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._next_flush = 0.0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+            atexit.register(self.flush)
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            weakref.finalize(threading.current_thread(), self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        """
+        Fold the shard of a thread that has ended into the retired totals
+        """
+        with self._shards_lock:
+            self._shards.remove(shard)
+            merge_totals(self._retired, shard.items())
+
+    def record(self, endpoint, method, status, duration, queries=0, db_time=0.0):
+        shard = self._shard()
+        key = (endpoint, method, status)
+        values = shard.get(key)
+        if values is None:
+            values = shard[key] = [0, 0.0, 0, 0.0] + [0] * (len(self.buckets) + 1)
+        values[COUNT] += 1
+        values[DURATION] += duration
+        values[QUERIES] += queries
+        values[DB_TIME] += db_time
+        values[BUCKETS + bisect.bisect_left(self.buckets, duration)] += 1
+
+    def start_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def finish_request(self, response):
+        started = g.get("metrics_started")
+        if started is None:
+            return response
+
+        rule = request.url_rule
+        queries = g.get("queries")
+        self.record(
+            endpoint_label(rule.rule) if rule is not None else "unmatched",
+            request.method,
+            response.status_code,
+            time.perf_counter() - started,
+            queries.count if queries is not None else 0,
+            queries.duration if queries is not None else 0.0,
+        )
+        if self.directory and time.monotonic() >= self._next_flush:
+            self.flush()
+        return response
+
+    def snapshot(self):
+        """
+        Merge the shards of every thread into one set of totals per series
+        """
+        with self._shards_lock:
+            shards = list(self._shards)
+            totals = {}
+            merge_totals(totals, self._retired.items())
+        for shard in shards:
+            merge_totals(totals, list(shard.items()))
+        return totals
+
+    def flush(self):
+        """
+        Write this worker's totals to its file in the metrics directory
+        """
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_flush = time.monotonic() + self.flush_interval
+            series = [[list(key), values] for key, values in self.snapshot().items()]
+            temporary_path = f"{self._path}.tmp"
+            with open(temporary_path, "w") as file:
+                json.dump({"buckets": self.buckets, "series": series}, file)
+            os.replace(temporary_path, self._path)
+        except OSError as e:
+            self.logger.warning(f"Could not write metrics to {self._path}: {e}")
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        """
+        Totals of this worker, or of every worker when aggregating through files
+        """
+        if not self.directory:
+            return self.snapshot()
+
+        self.flush()
+        totals = {}
+        for name in os.listdir(self.directory):
+            if not (name.startswith("metrics-") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    data = json.load(file)
+            except (OSError, ValueError):
+                continue
+            if tuple(data["buckets"]) != self.buckets:
+                continue
+            merge_totals(totals, ((tuple(key), values) for key, values in data["series"]))
+        return totals
+
+    def render(self):
+        """
+        The metrics in the Prometheus text exposition format
+        """
+        totals = sorted(self.collect().items())
+        lines = [
+            "# HELP http_request_duration_seconds Time spent handling requests.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (endpoint, method, status), values in totals:
+            labels = f'endpoint="{escape_label(endpoint)}",method="{method}",status="{status}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values[BUCKETS:]):
+                cumulative += count
+                lines.append(
+                    f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {format_number(values[DURATION])}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {values[COUNT]}")
+
+        for name, index, help_text in (
+            ("http_requests_total", COUNT, "Requests handled."),
+            ("db_queries_total", QUERIES, "SQL statements run while handling requests."),
+            ("db_query_duration_seconds_total", DB_TIME, "Time spent in SQL statements while handling requests."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (endpoint, method, status), values in totals:
+                labels = f'endpoint="{escape_label(endpoint)}",method="{method}",status="{status}"'
+                lines.append(f"{name}{{{labels}}} {format_number(values[index])}")
+        return "\n".join(lines) + "\n"
+
+    def metrics_view(self):
+        if not self.token:
+            abort(404)
+        expected = f"Bearer {self.token}".encode()
+        if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), expected):
+            abort(401)
+        return self.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
@@ -1,10 +1,15 @@
+from sqlalchemy import delete, exists, insert, select
+
 from ..database import db
+from .versions import bump_versions, version_column
 
 
 enrollment = db.Table(
     "enrollment",
-    db.Column("course_id", db.Integer, db.ForeignKey("course.id")),
-    db.Column("student_id", db.Integer, db.ForeignKey("student.id")),
+    db.Column("course_id", db.Integer, db.ForeignKey("course.id"), primary_key=True),
+    db.Column("student_id", db.Integer, db.ForeignKey("student.id"), primary_key=True),
+    # The primary key leads with course_id, so look ups by student need their own index
+    db.Index("ix_enrollment_student_id", "student_id"),
 )
 
 
@@ -15,12 +20,20 @@ class Course(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(10), nullable=False, unique=True)
     course_code = db.Column(db.String(6), nullable=False, unique=True)
-    credit_unit = db.Column(db.Integer, nullable=False, default=1)
+    # active_history keeps the previous value around for the GPA totals listeners
+    credit_unit = db.column_property(
+        db.Column(db.Integer, nullable=False, default=1), active_history=True
+    )
 
-    teacher_id = db.Column(db.Integer, db.ForeignKey("teacher.id"))
+    teacher_id = db.Column(db.Integer, db.ForeignKey("teacher.id"), index=True)
+    # Bumped on every write, and on enrolments since they change student_count
+    version = version_column()
 
-    # many-to-many relationship with student model
-    students = db.relationship("Student", secondary=enrollment, backref="courses")
+    # many-to-many relationship with student model, queried rather than loaded
+    # whole so rosters can be counted and paged in SQL
+    students = db.relationship(
+        "Student", secondary=enrollment, backref="courses", lazy="dynamic"
+    )
 
     def __init__(self, title, course_code, credit_unit, **kwargs):
         self.title = title
@@ -44,6 +57,95 @@ class Course(db.Model):
         db.session.delete(self)
         db.session.commit()
 
+    @property
+    def student_count(self):
+        return self.students.count()
+
     @classmethod
     def get_by_title(cls, course_title):
         return cls.query.filter_by(title=course_title).first_or_404()
+
+    # The enrolment helpers below work on the enrollment table directly
+    # so that the course roster never has to be loaded.
+
+    def has_student(self, student_id):
+        """
+        Check whether a student is enrolled in this course
+        """
+        return db.session.execute(
+            select(
+                exists().where(
+                    enrollment.c.course_id == self.id,
+                    enrollment.c.student_id == student_id,
+                )
+            )
+        ).scalar()
+
+    def enroll(self, student_id):
+        db.session.execute(insert(enrollment).values(course_id=self.id, student_id=student_id))
+        bump_enrolment_versions({self.id}, {student_id})
+
+    @staticmethod
+    def enroll_many(pairs):
+        """
+        Enrol many (course_id, student_id) pairs at once, skipping the ones
+        that already exist. Returns the set of pairs that were already enrolled.
+        """
+        pairs = set(pairs)
+        if not pairs:
+            return set()
+
+        course_ids = {course_id for course_id, _ in pairs}
+        student_ids = {student_id for _, student_id in pairs}
+        existing = {
+            tuple(row)
+            for row in db.session.execute(
+                select(enrollment.c.course_id, enrollment.c.student_id).where(
+                    enrollment.c.course_id.in_(course_ids),
+                    enrollment.c.student_id.in_(student_ids),
+                )
+            )
+        } & pairs
+
+        new_pairs = pairs - existing
+        if new_pairs:
+            db.session.execute(
+                insert(enrollment),
+                [
+                    {"course_id": course_id, "student_id": student_id}
+                    for course_id, student_id in sorted(new_pairs)
+                ],
+            )
+            bump_enrolment_versions(
+                {course_id for course_id, _ in new_pairs},
+                {student_id for _, student_id in new_pairs},
+            )
+        return existing
+
+    def unenroll(self, student_id):
+        """
+        Remove a student from this course. Returns False if they were not enrolled.
+        """
+        result = db.session.execute(
+            delete(enrollment).where(
+                enrollment.c.course_id == self.id,
+                enrollment.c.student_id == student_id,
+            )
+        )
+        if not result.rowcount:
+            return False
+        bump_enrolment_versions({self.id}, {student_id})
+        return True
+
+
+def bump_enrolment_versions(course_ids, student_ids):
+    """
+    Enrolments change the student count of a course and the result of a
+    student, so bump the versions of both
+    """
+    connection = db.session.connection()
+    student = db.metadata.tables["student"]
+    # Their grade totals only count enrolled courses and are recomputed on commit
+    db.session.info.setdefault("enrolments_changed", set()).update(student_ids)
+    bump_versions(connection, Course.__table__, Course.__table__.c.id.in_(course_ids))
+    bump_versions(connection, student, student.c.id.in_(student_ids))
@@ -1,13 +1,9 @@
-from enum import Enum
-
+from .scales import get_grading_scale
 from ..database import db
+from .versions import version_column
 
 
-class LetterGrades(Enum):
-    A = range(70, 101)  # 70 - 100
-    B = range(50, 70)   # 50 - 69
-    C = range(30, 50)   # 30 - 49
-    D = range(0, 30)    # 0 - 29
+GRADE_POINTS = {"A": 4.00, "B": 3.00, "C": 2.00, "D": 1.00, "F": 0.00}
 
 
 class Grade(db.Model):
@@ -15,9 +11,11 @@ class Grade(db.Model):
     __tablename__ = "grades"
 
     student_id = db.Column(db.Integer, db.ForeignKey("student.id"), primary_key=True)
-    course_id = db.Column(db.Integer, db.ForeignKey("course.id"), primary_key=True)
+    # The primary key leads with student_id, so look ups by course need their own index
+    course_id = db.Column(db.Integer, db.ForeignKey("course.id"), primary_key=True, index=True)
     score = db.Column(db.Float, default=0.0)
-    letter_grade = db.Column(db.CHAR(1), default="D")
+    letter_grade = db.column_property(db.Column(db.CHAR(1), default="D"), active_history=True)
+    version = version_column()
 
     def __repr__(self):
         return f"<Grade: {self.student_id} - {self.course_id} - {self.score}>"
@@ -32,13 +30,10 @@ class Grade(db.Model):
 
     def delete(self):
         db.session.delete(self)
-        self.score = 0.0
-        self.letter_grade = "D"
         db.session.commit()
 
     def allocate_letter_grade(self):
-        for letter in LetterGrades:
-            if round(self.score) in letter.value:
-                self.letter_grade = letter.name
-                break
-        return
\ No newline at end of file
+        letter_grade = get_grading_scale(self.course_id).letter_for(self.score)
+        if letter_grade is not None:
+            self.letter_grade = letter_grade
+        return
@@ -0,0 +1,67 @@
+from sqlalchemy import delete, event, insert, inspect
+
+from .users import User
+from ..database import db
+
+
+class Identity(db.Model):
+    """
+    Model for every login key (email address or school ID) and the user it belongs to.
+    Its primary key makes email addresses unique across admins, teachers and students.
+    """
+
+    __tablename__ = "identity"
+    __table_args__ = (db.Index("ix_identity_role_user_id", "role", "user_id"),)
+
+    key = db.Column(db.String(), primary_key=True)
+    role = db.Column(db.String(), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<Identity: {self.key}>"
+
+    @classmethod
+    def find(cls, key):
+        return db.session.get(cls, key)
+
+    @classmethod
+    def find_taken(cls, keys):
+        """
+        Get the keys among `keys` that already belong to a user with a single query
+        """
+        return {key for key, in db.session.query(cls.key).filter(cls.key.in_(keys))}
+
+
+def identity_rows(role, user_id, email_address, school_id=None):
+    rows = [{"key": email_address, "role": role, "user_id": user_id}]
+    if school_id:
+        rows.append({"key": school_id, "role": role, "user_id": user_id})
+    return rows
+
+
+def user_identity_rows(user):
+    return identity_rows(user.role, user.id, user.email_address, getattr(user, "school_id", None))
+
+
+@event.listens_for(User, "after_insert", propagate=True)
+def add_identities(mapper, connection, target):
+    connection.execute(insert(Identity), user_identity_rows(target))
+
+
+@event.listens_for(User, "after_update", propagate=True)
+def update_identities(mapper, connection, target):
+    state = inspect(target)
+    changed = [
+        state.attrs[key].history.has_changes()
+        for key in ("email_address", "school_id") if key in state.attrs
+    ]
+    if any(changed):
+        remove_identities(mapper, connection, target)
+        add_identities(mapper, connection, target)
+
+
+@event.listens_for(User, "after_delete", propagate=True)
+def remove_identities(mapper, connection, target):
+    connection.execute(
+        delete(Identity).where(Identity.role == target.role, Identity.user_id == target.id)
+    )
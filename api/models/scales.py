@@ -0,0 +1,141 @@
+import threading
+import time
+from bisect import bisect_right
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from ..database import db
+
+
+MAX_SCORE = 100
+
+# Used when no default grading scale has been stored
+DEFAULT_GRADING_BANDS = [
+    {"letter": "A", "min_score": 70},  # 70 - 100
+    {"letter": "B", "min_score": 50},  # 50 - 69
+    {"letter": "C", "min_score": 30},  # 30 - 49
+    {"letter": "D", "min_score": 0},   # 0 - 29
+]
+
+
+class GradingScale(db.Model):
+    """
+    Score bands that map scores to letter grades. The scale without a course
+    is the school default, the others override it for their course.
+    """
+
+    __tablename__ = "grading_scale"
+
+    id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey("course.id"), unique=True, nullable=True)
+    bands = db.Column(db.JSON, nullable=False)
+
+    def __repr__(self):
+        return f"<GradingScale: {self.course_id or 'default'}>"
+
+    def save(self):
+        db.session.add(self)
+        db.session.commit()
+
+    @staticmethod
+    def commit_update():
+        db.session.commit()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+
+
+class CompiledScale:
+    """
+    A grading scale compiled into a sorted array of band boundaries
+    """
+
+    def __init__(self, bands):
+        ordered = sorted((band["min_score"], band["letter"]) for band in bands)
+        self.boundaries = [min_score for min_score, _ in ordered]
+        self.letters = [letter for _, letter in ordered]
+
+        # Rounded scores are whole numbers, so batches are looked up in a flat table
+        self.table = [self.letter_for(score) for score in range(MAX_SCORE + 1)]
+
+    def letter_for(self, score):
+        """
+        Get the letter grade of a score, or None if it is outside the scale
+        """
+        rounded_score = round(score)
+        if rounded_score > MAX_SCORE:
+            return None
+        index = bisect_right(self.boundaries, rounded_score) - 1
+        return self.letters[index] if index >= 0 else None
+
+    def letters_for(self, scores):
+        """
+        Get the letter grades of many scores at once
+        """
+        table = self.table
+        return [
+            table[rounded] if 0 <= (rounded := round(score)) <= MAX_SCORE else None
+            for score in scores
+        ]
+
+
+class GradingScaleCache:
+    """
+    Per worker cache of compiled grading scales, keyed by course ID.
+
+    Entries are dropped whenever a scale change is committed in this worker and
+    expire after `ttl` seconds so edits made by other workers are picked up.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._scales = {}
+
+    def get(self, course_id):
+        now = time.monotonic()
+        cached = self._scales.get(course_id)
+        if cached is not None and now - cached[1] < self.ttl:
+            return cached[0]
+
+        scales = GradingScale.query.filter(
+            (GradingScale.course_id == course_id) | GradingScale.course_id.is_(None)
+        ).all()
+        scale = next((scale for scale in scales if scale.course_id is not None), None)
+        scale = scale or next(iter(scales), None)
+        compiled = CompiledScale(scale.bands if scale else DEFAULT_GRADING_BANDS)
+
+        with self._lock:
+            self._scales[course_id] = (compiled, now)
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._scales.clear()
+
+
+def get_grading_scale(course_id):
+    """
+    Get the compiled grading scale used by a course
+    """
+    return current_app.extensions["grading_scales"].get(course_id)
+
+
+@event.listens_for(GradingScale, "after_insert")
+@event.listens_for(GradingScale, "after_update")
+@event.listens_for(GradingScale, "after_delete")
+def mark_grading_scales_changed(mapper, connection, target):
+    # Clearing now would let other requests cache the old bands again before the commit
+    object_session(target).info["grading_scales_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def invalidate_grading_scales(session):
+    # Changing the default scale affects every course, so drop everything. After a
+    # rollback too, as this session may have cached the bands it rolled back.
+    if session.info.pop("grading_scales_changed", False):
+        current_app.extensions["grading_scales"].clear()
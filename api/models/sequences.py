@@ -0,0 +1,88 @@
+import threading
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from ..database import db
+
+
+class SchoolIdSequence(db.Model):
+    """
+    Database-backed counter for the number part of school IDs, one row per year
+    """
+
+    __tablename__ = "school_id_sequence"
+
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    next_value = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<SchoolIdSequence: {self.year} - {self.next_value}>"
+
+    @classmethod
+    def reserve(cls, year, count, retries=3):
+        """
+        Reserve `count` consecutive numbers for `year` and return the first one.
+
+        The reservation runs on its own connection and is committed straight
+        away, so a block is never handed out twice even if the request that
+        asked for it is rolled back.
+        """
+        table = cls.__table__
+        for _ in range(retries):
+            try:
+                with db.engine.begin() as connection:
+                    result = connection.execute(
+                        update(table)
+                        .where(table.c.year == year)
+                        .values(next_value=table.c.next_value + count)
+                    )
+                    if result.rowcount == 0:
+                        connection.execute(insert(table).values(year=year, next_value=1 + count))
+                        return 1
+
+                    next_value = connection.execute(
+                        select(table.c.next_value).where(table.c.year == year)
+                    ).scalar_one()
+                    return next_value - count
+
+            # Another worker created the row for this year first
+            except IntegrityError:
+                continue
+
+        raise RuntimeError(f"Could not reserve school ID numbers for {year}")
+
+
+class SchoolIdAllocator:
+    """
+    Hands out school ID numbers from blocks reserved in `SchoolIdSequence`.
+
+    Each worker process keeps its own block, so creating a student only goes
+    to the database when the block runs out, and bulk creation reserves all
+    the numbers it needs at once.
+    """
+
+    def __init__(self, block_size=100):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = {}
+
+    def allocate(self, year, count=1):
+        """
+        Get `count` unused numbers for `year`
+        """
+        numbers = []
+        with self._lock:
+            next_value, end = self._blocks.get(year, (0, 0))
+            while len(numbers) < count:
+                if next_value >= end:
+                    size = max(self.block_size, count - len(numbers))
+                    next_value = SchoolIdSequence.reserve(year, size)
+                    end = next_value + size
+
+                take = min(end - next_value, count - len(numbers))
+                numbers.extend(range(next_value, next_value + take))
+                next_value += take
+
+            self._blocks[year] = (next_value, end)
+        return numbers
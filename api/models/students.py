@@ -1,7 +1,15 @@
+import re
+import unicodedata
 from datetime import date
 
+from flask import current_app
+from sqlalchemy import case, delete, event, exists, func, inspect, literal_column, select, update
+from sqlalchemy.orm import Session
+
 from .users import User
-from .grades import Grade
+from .courses import Course, enrollment
+from .grades import GRADE_POINTS, Grade
+from .versions import bump_versions, version_column
 from ..database import db
 
 
@@ -14,7 +22,13 @@ class Student(User):
 
     id = db.Column(db.Integer, primary_key=True)
     school_id = db.Column(db.String(), index=True, unique=True)
-    gpa = db.Column(db.Float(asdecimal=True))
+    gpa = db.Column(db.Float(asdecimal=True), index=True)
+
+    # Running totals the GPA is derived from, kept up to date on every grade write
+    total_points = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
+    total_credit_units = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Bumped on every write and whenever the student's result changes, see bump_versions
+    version = version_column()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -31,29 +45,358 @@ class Student(User):
 
     def generate_school_id(self):
         """"
-        Generate a school ID for every student from their full name
+        Generate a school ID for every student from their first name
+        """
+        return self.generate_school_ids([self.full_name])[0]
+
+    @staticmethod
+    def generate_school_ids(full_names):
+        """
+        Generate school IDs for many students, reserving their numbers at once
         """
-        full_name = self.full_name
-        first_name = full_name.split()[0]
-        hashed_name = hash(full_name)
-        num = hashed_name % 1000000
-        school_id = f"ALT/{first_name.upper()}{num}/{date.today().year}"
-        return school_id
-
-    def calculate_student_gpa(self):
+        year = date.today().year
+        allocator = current_app.extensions["school_id_allocator"]
+        numbers = allocator.allocate(year, len(full_names))
+        return [
+            format_school_id(full_name, number, year)
+            for full_name, number in zip(full_names, numbers)
+        ]
+
+    def get_transcript(self):
         """
-        Calculate the GPA of a student.
+        Get the student's grade in every registered course and their GPA.
+
+        The courses, their credit units and the student's grades are loaded
+        with a single joined query. Courses that have not been graded yet are
+        listed with a `None` grade and left out of the GPA.
         """
-        grade_points = {"A": 4.00, "B": 3.00, "C": 2.00, "D": 1.00, "F": 0.00}
+        rows = (
+            db.session.query(Course.title, Course.credit_unit, Grade.letter_grade)
+            .join(enrollment, enrollment.c.course_id == Course.id)
+            .outerjoin(
+                Grade,
+                (Grade.course_id == Course.id)
+                & (Grade.student_id == enrollment.c.student_id),
+            )
+            .filter(enrollment.c.student_id == self.id)
+            .order_by(Course.id)
+            .all()
+        )
+
+        course_results = []
         total_credit_unit = total_points = 0
 
-        for course in self.courses:
-            grade = Grade.query.get((self.id, course.id))
-            point = grade_points[grade.letter_grade] * course.credit_unit
-            total_points += point
-            total_credit_unit += course.credit_unit
+        for title, credit_unit, letter_grade in rows:
+            course_results.append({"course_title": title, "grade": letter_grade})
+            if letter_grade is None:
+                continue
+            total_points += GRADE_POINTS[letter_grade] * credit_unit
+            total_credit_unit += credit_unit
+
+        gpa = round(total_points / total_credit_unit, 2) if total_credit_unit else None
+        return course_results, gpa
+
+    @classmethod
+    def reconcile_grade_totals(cls, fix=True):
+        """
+        Recompute the grade totals of every student in bulk and report those
+        whose stored totals have drifted from their grades.
+        """
+        actual = {
+            student_id: (total_points, total_credit_units)
+            for student_id, total_points, total_credit_units
+            in db.session.execute(grade_totals_query())
+        }
+        stored = db.session.execute(
+            select(cls.id, cls.total_points, cls.total_credit_units, cls.gpa)
+        )
+
+        drift = []
+        for student_id, total_points, total_credit_units, gpa in stored:
+            expected_points, expected_credit_units = actual.get(student_id, (0.0, 0))
+            expected_gpa = compute_gpa(expected_points, expected_credit_units)
+            if (
+                abs(total_points - expected_points) > 1e-9
+                or total_credit_units != expected_credit_units
+                or (gpa is None) != (expected_gpa is None)
+                or (gpa is not None and abs(float(gpa) - expected_gpa) > 1e-9)
+            ):
+                drift.append({
+                    "student_id": student_id,
+                    "stored": (total_points, total_credit_units, gpa and float(gpa)),
+                    "expected": (expected_points, expected_credit_units, expected_gpa),
+                })
+
+        if fix and drift:
+            db.session.execute(
+                update(cls),
+                [
+                    {
+                        "id": item["student_id"],
+                        "total_points": item["expected"][0],
+                        "total_credit_units": item["expected"][1],
+                        "gpa": item["expected"][2],
+                    }
+                    for item in drift
+                ],
+            )
+            cls.commit_update()
+
+        return drift
+
+
+def format_school_id(full_name, number, year):
+    if number > 999999:
+        raise RuntimeError(f"Ran out of school ID numbers for {year}")
+
+    first_name = full_name.split()[0]
+    ascii_name = unicodedata.normalize("NFKD", first_name).encode("ascii", "ignore").decode()
+    letters = re.sub(r"[^A-Z]", "", ascii_name.upper()) or "X"
+    return f"ALT/{letters}{number:06d}/{year}"
+
+
+def compute_gpa(total_points, total_credit_units):
+    if not total_credit_units:
+        return None
+    return round(total_points / total_credit_units, 2)
+
+
+def grade_points_expr(letter_grade):
+    """
+    SQL expression mapping a letter grade column to its grade point.
+    """
+    return case(
+        *((letter_grade == letter, point) for letter, point in GRADE_POINTS.items()),
+        else_=0.0,
+    )
+
+
+def grade_totals_query():
+    """
+    Select (student_id, total_points, total_credit_units) for every graded student.
+    """
+    return (
+        select(
+            Grade.student_id,
+            func.sum(grade_points_expr(Grade.letter_grade) * Course.credit_unit),
+            func.sum(Course.credit_unit),
+        )
+        .join(Course, Course.id == Grade.course_id)
+        # Only enrolled courses count, as in the transcript
+        .join(
+            enrollment,
+            (enrollment.c.course_id == Grade.course_id) & (enrollment.c.student_id == Grade.student_id),
+        )
+        .group_by(Grade.student_id)
+    )
+
+
+def gpa_expr(total_points, total_credit_units):
+    """
+    SQL expression for the GPA of the given grade totals.
+    """
+    return case(
+        (total_credit_units > 0, func.round(total_points / total_credit_units, 2)),
+        else_=None,
+    )
+
+
+def shift_grade_totals(connection, condition, points, credit_units, params=None):
+    """
+    Add `points` and `credit_units` to the grade totals of the students matching
+    `condition` and derive their GPA from the new totals, in one UPDATE statement.
+    """
+    table = Student.__table__
+    total_points = table.c.total_points + points
+    total_credit_units = table.c.total_credit_units + credit_units
+    connection.execute(
+        update(table)
+        .where(condition)
+        .values(
+            total_points=total_points,
+            total_credit_units=total_credit_units,
+            gpa=gpa_expr(total_points, total_credit_units),
+        ),
+        params,
+    )
+
+
+def recompute_grade_totals(connection, condition):
+    """
+    Recompute the grade totals and GPA of the students matching `condition`
+    from their grades in enrolled courses, in one UPDATE statement.
+    """
+    table = Student.__table__
+    totals = grade_totals_query().where(Grade.student_id == table.c.id)
+    total_points = func.coalesce(
+        totals.with_only_columns(totals.selected_columns[1]).scalar_subquery(), 0.0
+    )
+    total_credit_units = func.coalesce(
+        totals.with_only_columns(totals.selected_columns[2]).scalar_subquery(), 0
+    )
+    connection.execute(
+        update(table)
+        .where(condition)
+        .values(
+            total_points=total_points,
+            total_credit_units=total_credit_units,
+            gpa=gpa_expr(total_points, total_credit_units),
+        )
+    )
+
+
+def _committed_value(target, attr):
+    history = inspect(target).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, attr)
+
+
+def _course_credit_unit(course_id):
+    return select(Course.credit_unit).where(Course.id == course_id).scalar_subquery()
+
+
+def _enrolled(grade):
+    # Grades only count towards the totals while the student is enrolled in the course
+    return (Student.__table__.c.id == grade.student_id) & exists().where(
+        enrollment.c.course_id == grade.course_id,
+        enrollment.c.student_id == grade.student_id,
+    )
+
+
+@event.listens_for(Grade, "after_insert")
+def add_grade_to_totals(mapper, connection, target):
+    credit_unit = _course_credit_unit(target.course_id)
+    shift_grade_totals(
+        connection,
+        _enrolled(target),
+        GRADE_POINTS[target.letter_grade] * credit_unit,
+        credit_unit,
+    )
+
+
+@event.listens_for(Grade, "after_update")
+def update_grade_in_totals(mapper, connection, target):
+    history = inspect(target).attrs.letter_grade.history
+    if not history.has_changes() or not history.deleted:
+        return
+    old_point = GRADE_POINTS[history.deleted[0]]
+    new_point = GRADE_POINTS[target.letter_grade]
+    if old_point == new_point:
+        return
+    shift_grade_totals(
+        connection,
+        _enrolled(target),
+        (new_point - old_point) * _course_credit_unit(target.course_id),
+        0,
+    )
+
+
+@event.listens_for(Grade, "after_delete")
+def remove_grade_from_totals(mapper, connection, target):
+    credit_unit = _course_credit_unit(target.course_id)
+    shift_grade_totals(
+        connection,
+        _enrolled(target),
+        -GRADE_POINTS[_committed_value(target, "letter_grade")] * credit_unit,
+        -credit_unit,
+    )
+
+
+def _shift_course_credit_unit(connection, course_id, delta):
+    graded_students = (
+        select(Grade.student_id)
+        .join(
+            enrollment,
+            (enrollment.c.course_id == Grade.course_id) & (enrollment.c.student_id == Grade.student_id),
+        )
+        .where(Grade.course_id == course_id)
+    )
+    student_grade_point = (
+        select(grade_points_expr(Grade.letter_grade))
+        .where(Grade.student_id == Student.__table__.c.id, Grade.course_id == course_id)
+        .scalar_subquery()
+    )
+    shift_grade_totals(
+        connection,
+        Student.__table__.c.id.in_(graded_students),
+        student_grade_point * delta,
+        delta,
+    )
+
+
+@event.listens_for(Course, "after_update")
+def update_credit_unit_in_totals(mapper, connection, target):
+    history = inspect(target).attrs.credit_unit.history
+    if not history.has_changes() or not history.deleted:
+        return
+    delta = target.credit_unit - history.deleted[0]
+    if delta:
+        _shift_course_credit_unit(connection, target.id, delta)
+
+
+def _bump_enrolled_students(connection, course_id):
+    enrolled_students = select(enrollment.c.student_id).where(enrollment.c.course_id == course_id)
+    bump_versions(connection, Student.__table__, Student.__table__.c.id.in_(enrolled_students))
+
+
+@event.listens_for(Course, "after_update")
+def bump_results_on_course_rename(mapper, connection, target):
+    # Results list course titles, so a rename changes the result of every enrolled student
+    if inspect(target).attrs.title.history.deleted:
+        _bump_enrolled_students(connection, target.id)
+
+
+@event.listens_for(Session, "before_flush")
+def clean_up_on_delete(session, flush_context, instances):
+    """
+    Deleting a course or a student also drops their enrolments, which changes
+    the results of the course's students and the student count of the
+    student's courses. Bump those before the flush deletes the enrolments.
+
+    Their grades are deleted in the same flush, as SQLite reuses the freed
+    ID and a new course or student would otherwise inherit them. A course's
+    grades are first taken off its students' totals.
+    """
+    connection = session.connection()
+    course = Course.__table__
+    grades = Grade.__table__
+    for obj in session.deleted:
+        if isinstance(obj, Course):
+            _bump_enrolled_students(connection, obj.id)
+            _shift_course_credit_unit(connection, obj.id, -_committed_value(obj, "credit_unit"))
+            connection.execute(delete(grades).where(grades.c.course_id == obj.id))
+        elif isinstance(obj, Student):
+            enrolled_courses = select(enrollment.c.course_id).where(enrollment.c.student_id == obj.id)
+            bump_versions(connection, course, course.c.id.in_(enrolled_courses))
+            connection.execute(delete(grades).where(grades.c.student_id == obj.id))
+
+
+@event.listens_for(Course.students, "append")
+@event.listens_for(Course.students, "remove")
+def bump_versions_on_roster_change(target, value, initiator):
+    # Enrolments made through the relationship rather than Course.enroll
+    for obj in (target, value):
+        if inspect(obj).persistent:
+            obj.version = literal_column("version") + 1
+    if inspect(value).persistent:
+        db.session.info.setdefault("enrolments_changed", set()).add(value.id)
+
+
+@event.listens_for(Session, "before_commit")
+def recompute_totals_on_enrolment_change(session):
+    """
+    Enrolling in or leaving a graded course adds or removes its grade from the
+    student's totals, so recompute the totals of every student whose
+    enrolments changed once they have been flushed.
+    """
+    if "enrolments_changed" not in session.info:
+        return
+    session.flush()
+    student_ids = session.info.pop("enrolments_changed")
+    recompute_grade_totals(session.connection(), Student.__table__.c.id.in_(student_ids))
+
 
-        student_gpa = round(total_points / total_credit_unit, 2)
-        self.gpa = student_gpa
-        self.commit_update()
-        return student_gpa
+@event.listens_for(Session, "after_rollback")
+def forget_enrolment_changes(session):
+    session.info.pop("enrolments_changed", None)
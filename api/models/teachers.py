@@ -1,4 +1,8 @@
+from sqlalchemy import event, inspect
+
+from .courses import Course
 from .users import User
+from .versions import bump_versions
 from ..database import db
 
 
@@ -17,3 +21,20 @@ class Teacher(User):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.role = "STAFF"
+
+
+def _bump_taught_courses(connection, teacher_id):
+    bump_versions(connection, Course.__table__, Course.__table__.c.teacher_id == teacher_id)
+
+
+@event.listens_for(Teacher, "after_update")
+def bump_courses_on_teacher_update(mapper, connection, target):
+    # Courses nest their teacher's details, so a change to them changes the course
+    state = inspect(target)
+    if any(state.attrs[key].history.deleted for key in ("full_name", "email_address")):
+        _bump_taught_courses(connection, target.id)
+
+
+@event.listens_for(Teacher, "before_delete")
+def bump_courses_on_teacher_delete(mapper, connection, target):
+    _bump_taught_courses(connection, target.id)
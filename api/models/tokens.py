@@ -0,0 +1,19 @@
+from ..database import db
+
+
+class RevokedToken(db.Model):
+    """
+    Model for revoked (logged out) JWTs, kept until the token expires
+    """
+
+    __tablename__ = "revoked_token"
+    # AUTOINCREMENT so ids are never reused after a prune, which workers rely on to sync
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    # Unix timestamp of the token's `exp` claim
+    expires_at = db.Column(db.Integer, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<RevokedToken: {self.jti}>"
@@ -1,8 +1,36 @@
+import threading
+import time
+from functools import lru_cache
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
 from ..database import db
 
 from werkzeug.security import generate_password_hash
 
 
+def password_hash_method():
+    """
+    The configured hash method for new passwords
+    """
+    return current_app.config.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256")
+
+
+@lru_cache(maxsize=8)
+def _cached_password_hash(password_str, method):
+    return generate_password_hash(password_str, method)
+
+
+def default_password_hash(password_str):
+    """
+    Hash a default password once and reuse the hash for every account created with it.
+    """
+    return _cached_password_hash(password_str, password_hash_method())
+
+
 class User(db.Model):
     """
     Base model for all users including students, teachers and admins.
@@ -15,10 +43,12 @@ class User(db.Model):
     password_hash = db.Column(db.String(), nullable=False)
     role = db.Column(db.String(), nullable=False)
 
-    def __init__(self, full_name, email_address, password_str):
+    def __init__(self, full_name, email_address, password_str=None, password_hash=None):
         self.full_name = full_name
         self.email_address = email_address
-        self.password_hash = generate_password_hash(password_str)
+        self.password_hash = password_hash or generate_password_hash(
+            password_str, password_hash_method()
+        )
 
     def __repr__(self):
         return f"<{self.__class__.__name__}: {self.full_name}>"
@@ -52,3 +82,62 @@ class Admin(User):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.role = "ADMIN"
+
+
+class UserCache:
+    """
+    Process level cache of the users behind access tokens, keyed by model and ID.
+
+    Only the columns that identify a user are cached, and the user is merged
+    into the request's session without a query, so the session's identity map
+    then serves every other lookup of the same user during the request. Any
+    other column (GPA, grade totals, password hash, ...) is loaded fresh from
+    the database the first time it is read. Entries are dropped when the user
+    is updated or deleted in this worker and expire after `ttl` seconds, which
+    bounds how long identity changes made by other workers go unseen.
+    A `ttl` of 0 turns the cache off.
+    """
+
+    CACHED_COLUMNS = ("id", "role", "email_address", "school_id")
+
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users = {}
+
+    def get(self, model, user_id):
+        key = (model, int(user_id))
+        if self.ttl > 0:
+            cached = self._users.get(key)
+            if cached is not None and time.monotonic() - cached[1] < self.ttl:
+                return self._attach(model, cached[0])
+
+        user = db.session.get(model, user_id)
+        if user is not None and self.ttl > 0:
+            column_attrs = inspect(model).column_attrs
+            values = {key: getattr(user, key) for key in self.CACHED_COLUMNS if key in column_attrs}
+            with self._lock:
+                self._users[key] = (values, time.monotonic())
+        return user
+
+    def invalidate(self, model, user_id):
+        with self._lock:
+            self._users.pop((model, user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    @staticmethod
+    def _attach(model, values):
+        user = inspect(model).class_manager.new_instance()
+        for key, value in values.items():
+            set_committed_value(user, key, value)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+
+@event.listens_for(User, "after_update", propagate=True)
+@event.listens_for(User, "after_delete", propagate=True)
+def invalidate_cached_user(mapper, connection, target):
+    current_app.extensions["user_cache"].invalidate(type(target), target.id)
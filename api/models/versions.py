@@ -0,0 +1,26 @@
+from sqlalchemy import literal_column, update
+
+from ..database import db
+
+
+def version_column():
+    """
+    A counter that starts at 1 and goes up with every UPDATE of the row,
+    including bulk UPDATE statements that never load the object
+    """
+    return db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+        server_default="1",
+        onupdate=literal_column("version") + 1,
+    )
+
+
+def bump_versions(connection, table, condition):
+    """
+    Bump the version of every row of `table` matching `condition`, for
+    changes the cached responses of those rows depend on but that do not
+    update the rows themselves (e.g. enrolments)
+    """
+    connection.execute(update(table).where(condition).values(version=table.c.version + 1))
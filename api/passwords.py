@@ -0,0 +1,62 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    """
+    Raised when too many password hashes are already waiting for a worker
+    """
+
+
+class PasswordHasher:
+    """
+    Bounded pool of threads that check and generate password hashes.
+
+    PBKDF2 releases the GIL, so up to `max_workers` hashes run in parallel while
+    the request threads wait on them. At most `max_pending` more hashes may
+    queue behind those; past that `HashingBusy` is raised so a login burst is
+    shed quickly instead of slowing every request down.
+    """
+
+    def __init__(self, method="pbkdf2:sha256", max_workers=None, max_pending=64):
+        self.method = method
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="password-hasher")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_pending:
+                raise HashingBusy()
+            self._in_flight += 1
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def check(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def generate(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def needs_rehash(self, password_hash):
+        """
+        Check if a hash was made with a different method or cost than `method`
+        """
+        return password_hash.split("$", 1)[0] != normalize_method(self.method)
+
+
+def normalize_method(method):
+    """
+    Spell out werkzeug's default PBKDF2 iterations, as stored in the hashes it makes
+    """
+    if method.startswith("pbkdf2:") and method.count(":") == 1:
+        return f"{method}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
@@ -1,11 +1,22 @@
 from http import HTTPStatus
 
-from flask_restx import Namespace, Resource, abort, marshal
+from flask import current_app
+from flask_restx import Namespace, Resource, abort
 from flask_jwt_extended import get_current_user
 
 from ..models.users import Admin
+from ..passwords import HashingBusy
+from ..serializers.marshalling import marshal
+from ..serializers.pagination import pagination_parser
 from ..serializers.users import admin_model, signup_model, user_input_model
-from ..util import admin_required, is_valid_email
+from ..util import (
+    admin_required,
+    email_in_use,
+    get_user_or_404,
+    is_valid_email,
+    paginated_response,
+    retry_later,
+)
 
 admin_ns = Namespace("Admin", "Admin operations")
 admin_ns.add_model(admin_model.name, admin_model)
@@ -40,10 +51,20 @@ class AdminSignUp(Resource):
         if password != confirm_password:
             error_msg = "Invalid password. Check your password and try again"
 
+        if email_in_use(email_address):
+            error_msg = f"User with email address: {email_address} already exists"
+
         if error_msg:
             abort(400, error_msg)
 
-        new_admin = Admin(full_name, email_address, password_str=password)
+        try:
+            password_hash = current_app.extensions["password_hasher"].generate(password)
+        except HashingBusy:
+            return retry_later(
+                HTTPStatus.SERVICE_UNAVAILABLE, "Too many sign ups at once, try again shortly", 1
+            )
+
+        new_admin = Admin(full_name, email_address, password_hash=password_hash)
         new_admin.save()
         admin_ns.logger.info(f"Created new Admin: {new_admin}")
         return marshal(new_admin, admin_model), HTTPStatus.CREATED
@@ -52,14 +73,15 @@ class AdminSignUp(Resource):
 @admin_ns.route("/")
 class AdminList(Resource):
 
-    @admin_ns.doc(description="Get all admins")
+    @admin_ns.doc(description="Get all admins, a page at a time")
+    @admin_ns.expect(pagination_parser)
     @admin_required()
     def get(self):
         """
         Get all admin users
         """
-        admins = Admin.query.all()
-        return marshal(admins, admin_model), HTTPStatus.OK
+        args = pagination_parser.parse_args()
+        return paginated_response(Admin.query, admin_model, args, [Admin.id]), HTTPStatus.OK
 
 
 @admin_ns.route("/<int:admin_id>")
@@ -74,7 +96,7 @@ class AdminRetrieveUpdateDelete(Resource):
         """
         Get an admin
         """
-        admin = Admin.query.get_or_404(admin_id)
+        admin = get_user_or_404(Admin, admin_id)
         current_user = get_current_user()
 
         if admin != current_user:
@@ -94,16 +116,20 @@ class AdminRetrieveUpdateDelete(Resource):
         """
         data = admin_ns.payload
 
-        admin = Admin.query.get_or_404(admin_id)
+        admin = get_user_or_404(Admin, admin_id)
         current_user = get_current_user()
 
         if admin != current_user:
             admin_ns.logger.warn(f"Unauthorized access: {current_user}")
             abort(403, message="You don't have rights to access this resource")
 
-        valid = is_valid_email(data.get("email_address"))
-        if valid != True:
-            abort(400, message=f"Invalid Email address: {valid}")
+        if "email_address" in data:
+            valid = is_valid_email(data["email_address"])
+            if valid != True:
+                abort(400, message=f"Invalid Email address: {valid}")
+
+        if email_in_use(data.get("email_address"), admin):
+            abort(400, message=f"User with email address: {data['email_address']} already exists")
 
         admin.full_name = data.get("full_name", admin.full_name)
         admin.email_address = data.get("email_address", admin.email_address)
@@ -118,7 +144,7 @@ class AdminRetrieveUpdateDelete(Resource):
         """
         Delete an admin
         """
-        admin = Admin.query.get_or_404(admin_id)
+        admin = get_user_or_404(Admin, admin_id)
         current_user = get_current_user()
 
         if admin != current_user:
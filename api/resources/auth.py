@@ -7,14 +7,12 @@ from flask_jwt_extended import (
     get_jwt,
     jwt_required
 )
+from flask import current_app, request
 from flask_restx import Namespace, Resource, abort
-from werkzeug.security import check_password_hash, generate_password_hash
 
-from ..models.students import Student
-from ..models.teachers import Teacher
-from ..models.users import Admin
+from ..passwords import HashingBusy
 from ..serializers.auth import  login_model, new_password_input
-from ..util import BLOCKLIST, is_valid_school_id, is_valid_email
+from ..util import find_user_by_identity, is_valid_school_id, is_valid_email, retry_later
 
 
 auth_ns = Namespace("Authentication", "Authentication related operations")
@@ -41,26 +39,49 @@ class Login(Resource):
         if not (school_id or email_address):
             abort(400, message="Provide a school ID or email address")
 
+        # Throttle attempts per client and per account before doing any hashing
+        wait = max(
+            current_app.extensions["login_ip_throttle"].hit(request.remote_addr),
+            current_app.extensions["login_identity_throttle"].hit(school_id or email_address),
+        )
+        if wait:
+            auth_ns.logger.warn(f"Throttled login attempt from {request.remote_addr}")
+            return retry_later(
+                HTTPStatus.TOO_MANY_REQUESTS, "Too many login attempts, try again later", wait
+            )
+
         user = None
 
         # Get the student if the school ID was provided
         if school_id and is_valid_school_id(school_id):
-            student = Student.query.filter_by(school_id=school_id).first()
-            user = student
+            user = find_user_by_identity(school_id, roles=("STUDENT",))
 
         # Check if the email provided belongs to an admin or teacher
         elif email_address and is_valid_email(email_address):
-            admin = Admin.find_by_email(email_address)
-            teacher = Teacher.find_by_email(email_address)
+            user = find_user_by_identity(email_address, roles=("ADMIN", "STAFF"))
 
             # Return 404 if no teacher or admin with the email address exists
-            if not (admin or teacher):
+            if user is None:
                 abort(404, message=f"User with email address: {email_address} not found")
 
-            user = teacher if teacher else admin
+        hasher = current_app.extensions["password_hasher"]
+        try:
+            valid = user is not None and hasher.check(user.password_hash, password)
+        except HashingBusy:
+            return retry_later(
+                HTTPStatus.SERVICE_UNAVAILABLE, "Too many logins at once, try again shortly", 1
+            )
 
         # Check the user against the provided password and create access and refresh tokens
-        if user and check_password_hash(user.password_hash, password):
+        if valid:
+            # Upgrade hashes made with an older method or cost while the password is at hand
+            if hasher.needs_rehash(user.password_hash):
+                try:
+                    user.password_hash = hasher.generate(password)
+                    user.commit_update()
+                except HashingBusy:
+                    auth_ns.logger.warn(f"Skipped rehashing the password of {user}")
+
             access_token = create_access_token(
                 identity=user.id, additional_claims={"role": user.role}
             )
@@ -107,7 +128,13 @@ class PasswordChange(Resource):
         data = auth_ns.payload
         new_password = data["new_password"]
         current_user = get_current_user()
-        current_user.password_hash = generate_password_hash(new_password)
+        try:
+            password_hash = current_app.extensions["password_hasher"].generate(new_password)
+        except HashingBusy:
+            return retry_later(
+                HTTPStatus.SERVICE_UNAVAILABLE, "Too many password changes at once, try again shortly", 1
+            )
+        current_user.password_hash = password_hash
         current_user.commit_update()
         msg = {"message": "Password changed successfully"}
         auth_ns.logger.warn(f"{current_user} has changed password!")
@@ -123,7 +150,6 @@ class Logout(Resource):
         Log out and revoke refresh token
         """
         token = get_jwt()
-        jti = token["jti"]
-        BLOCKLIST.add(jti)
+        current_app.extensions["token_blocklist"].revoke(token["jti"], token["exp"])
         auth_ns.logger.warn("User logged out!")
         return {"message": "Token revoked"}, HTTPStatus.OK
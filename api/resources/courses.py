@@ -1,35 +1,63 @@
 from http import HTTPStatus
 
 from flask_jwt_extended import jwt_required
-from flask_restx import Namespace, Resource, abort, marshal
+from flask_restx import Namespace, Resource, abort
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
+from ..database import db
 from ..models.courses import Course
 from ..models.students import Student
-from ..util import admin_required, is_valid_school_id
+from ..util import (
+    admin_required,
+    conditional_response,
+    is_valid_school_id,
+    page_versions,
+    paginated_response,
+)
 from ..serializers.courses import (
+    batch_register_model,
     course_input_model,
+    course_list_parser,
     course_output_model,
-    course_students_model,
+    course_detail_model,
+    course_students_parser,
     course_register_model,
 )
+from ..serializers.marshalling import marshal, prepare_query
+from ..serializers.users import student_model
 
 course_ns = Namespace("Courses", "The course namespace")
 course_ns.add_model(course_input_model.name, course_input_model)
 course_ns.add_model(course_output_model.name, course_output_model)
-course_ns.add_model(course_students_model.name, course_students_model)
+course_ns.add_model(course_detail_model.name, course_detail_model)
 course_ns.add_model(course_register_model.name, course_register_model)
+course_ns.add_model(batch_register_model.name, batch_register_model)
+
+MAX_BATCH_ENROLMENTS = 5000
 
 
 @course_ns.route("/")
 class CourseList(Resource):
 
+    @course_ns.doc(description="Get all available courses, a page at a time")
+    @course_ns.expect(course_list_parser)
     @jwt_required()
     def get(self):
         """
         Get all available courses
         """
-        all_courses = Course.query.all()
-        return marshal(all_courses, course_output_model), HTTPStatus.OK
+        args = course_list_parser.parse_args()
+        query = Course.query
+
+        if args["teacher_id"] is not None:
+            query = query.filter(Course.teacher_id == args["teacher_id"])
+
+        keys = [Course.id]
+        return conditional_response(
+            ("courses", page_versions(query, args, keys, Course.version)),
+            lambda: paginated_response(query, course_output_model, args, keys),
+        )
 
     @course_ns.expect(course_input_model, validate=True)
     @course_ns.doc(description="Add a new course")
@@ -65,15 +93,21 @@ class CourseRetrieveUpdateDelete(Resource):
 
     @course_ns.doc(
         params={"course_id": "The ID of the course"},
-        description="Retrieve a course and all the students enrolled for that course",
+        description="Retrieve a course and how many students are enrolled in it",
     )
     @jwt_required()
     def get(self, course_id):
         """
         Retrieve a single course
         """
-        course = Course.query.get_or_404(course_id)
-        return marshal(course, course_students_model), HTTPStatus.OK
+        version = db.first_or_404(select(Course.version).where(Course.id == course_id))
+
+        def build():
+            query = prepare_query(Course.query, course_detail_model)
+            course = query.filter(Course.id == course_id).first_or_404()
+            return marshal(course, course_detail_model)
+
+        return conditional_response(("course", course_id, version), build)
 
     @course_ns.doc(
         description="Update the details of a course",
@@ -108,6 +142,27 @@ class CourseRetrieveUpdateDelete(Resource):
         return None, HTTPStatus.NO_CONTENT
 
 
+@course_ns.route("/<int:course_id>/students")
+class CourseStudentList(Resource):
+
+    @course_ns.doc(
+        params={"course_id": "The ID of the course"},
+        description="Get the students enrolled in a course, a page at a time",
+    )
+    @course_ns.expect(course_students_parser)
+    @jwt_required()
+    def get(self, course_id):
+        """
+        Get the students enrolled in a course
+        """
+        args = course_students_parser.parse_args()
+        course = db.get_or_404(Course, course_id)
+        sort_key = Student.school_id if args["sort"] == "school_id" else Student.full_name
+        return paginated_response(
+            course.students, student_model, args, [sort_key, Student.id]
+        ), HTTPStatus.OK
+
+
 @course_ns.route("/enroll")
 class CourseRegister(Resource):
 
@@ -125,27 +180,22 @@ class CourseRegister(Resource):
             abort(400, message="Invalid school ID")
 
         student = Student.get_by_school_id(school_id)
+        titles = course_title if isinstance(course_title, list) else [course_title]
 
-        # To register for multiple courses at once
-        if isinstance(course_title, list):
-            for title in course_title:
-                course = Course.get_by_title(title)
-
-                # Abort if a student has already registered for the course
-                if student in course.students:
-                    abort(400, message=f"This student already enrolled for {course.title}")
+        for title in titles:
+            course = Course.get_by_title(title)
 
-                course.students.append(student)
-                course.commit_update()
-
-        else:
-            course = Course.get_by_title(course_title)
+            # Abort if a student has already registered for the course
+            if course.has_student(student.id):
+                abort(400, message=f"This student already enrolled for {course.title}")
 
-            if student in course.students:
+            try:
+                course.enroll(student.id)
+            except IntegrityError:
+                db.session.rollback()
                 abort(400, message=f"This student already enrolled for {course.title}")
 
-            course.students.append(student)
-            course.commit_update()
+        Course.commit_update()
 
         msg = {"message": f"Student: {school_id} has registered for {course_title}"}
         return msg, HTTPStatus.CREATED
@@ -168,9 +218,94 @@ class CourseRegister(Resource):
         student = Student.get_by_school_id(school_id)
 
         # Check that student registered for the course before unregistering
-        if student not in course.students:
+        if not course.unenroll(student.id):
             abort(400, message="This student did not register for this course")
 
-        course.students.remove(student)
         course.commit_update()
         return {"message": "Student unregistered."}, HTTPStatus.NO_CONTENT
+
+
+@course_ns.route("/enroll/batch")
+class CourseBatchRegister(Resource):
+
+    @course_ns.expect(batch_register_model, validate=True)
+    @course_ns.doc(
+        description="Enrol a student in many courses (school_id and course_titles) "
+                    "or many students in a course (course_title and school_ids) at once"
+    )
+    @jwt_required()
+    def post(self):
+        """
+        Register students for courses in bulk
+        """
+        data = course_ns.payload
+        school_id = data.get("school_id")
+        course_title = data.get("course_title")
+        course_titles = data.get("course_titles")
+        school_ids = data.get("school_ids")
+
+        if school_id and course_titles and not (course_title or school_ids):
+            by_student = True
+            items = course_titles
+        elif course_title and school_ids and not (school_id or course_titles):
+            by_student = False
+            items = school_ids
+        else:
+            abort(400, message="Provide a school_id with course_titles or a course_title with school_ids")
+
+        if len(items) > MAX_BATCH_ENROLMENTS:
+            abort(400, message=f"Enrol at most {MAX_BATCH_ENROLMENTS} at a time")
+
+        # Resolve every course title and school ID with one query each
+        titles = course_titles if by_student else [course_title]
+        ids = [school_id] if by_student else [item for item in school_ids if is_valid_school_id(item)]
+        course_ids = dict(db.session.query(Course.title, Course.id).filter(Course.title.in_(titles)))
+        student_ids = dict(
+            db.session.query(Student.school_id, Student.id).filter(Student.school_id.in_(ids))
+        )
+
+        if by_student and not is_valid_school_id(school_id):
+            abort(400, message="Invalid school ID")
+        if by_student and school_id not in student_ids:
+            abort(404, message=f"Student: {school_id} not found")
+        if not by_student and course_title not in course_ids:
+            abort(404, message=f"Course: {course_title} not found")
+
+        key = "course_title" if by_student else "school_id"
+        results = []
+        pairs = {}
+        seen = set()
+        for item in items:
+            if by_student:
+                pair = (course_ids.get(item), student_ids[school_id])
+            else:
+                pair = (course_ids[course_title], student_ids.get(item))
+
+            if not by_student and not is_valid_school_id(item):
+                status = "invalid school ID"
+            elif None in pair:
+                status = "not found"
+            elif pair in seen:
+                status = "duplicate"
+            else:
+                status = "enrolled"
+                pairs[item] = pair
+                seen.add(pair)
+            results.append({key: item, "status": status})
+
+        # Insert every new enrolment in one transaction
+        try:
+            existing = Course.enroll_many(pairs.values())
+            Course.commit_update()
+        except IntegrityError as e:
+            db.session.rollback()
+            course_ns.logger.error(e)
+            abort(409, message="These enrolments changed while registering, try again")
+
+        for result in results:
+            if result["status"] == "enrolled" and pairs[result[key]] in existing:
+                result["status"] = "already enrolled"
+
+        enrolled = sum(result["status"] == "enrolled" for result in results)
+        course_ns.logger.info(f"Batch enrolment: {enrolled} new enrolments")
+        return {"enrolled": enrolled, "results": results}, HTTPStatus.CREATED
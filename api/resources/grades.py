@@ -1,18 +1,166 @@
+import csv
+import io
 from http import HTTPStatus
 
+from flask import request
 from flask_jwt_extended import get_current_user, jwt_required
-from flask_restx import Namespace, Resource, abort, marshal
+from flask_restx import Namespace, Resource, abort
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from ..models.courses import Course
-from ..models.grades import Grade
-from ..models.students import Student
-from ..serializers.grades import grade_model, score_input
-from ..util import staff_required
+from ..database import db
+from ..models.courses import Course, enrollment
+from ..models.grades import GRADE_POINTS, Grade
+from ..models.scales import GradingScale, get_grading_scale
+from ..models.students import Student, recompute_grade_totals
+from ..serializers.export import export_parser
+from ..serializers.grades import (
+    bulk_score_input,
+    grade_model,
+    grading_band_model,
+    grading_scale_input,
+    grading_scale_model,
+    score_input,
+)
+from ..serializers.marshalling import marshal
+from ..util import admin_required, staff_required, stream_export
 
 
 grade_ns = Namespace("Grade system", "Everything about grading")
 grade_ns.add_model(grade_model.name, grade_model)
 grade_ns.add_model(score_input.name, score_input)
+grade_ns.add_model(bulk_score_input.name, bulk_score_input)
+grade_ns.add_model(grading_band_model.name, grading_band_model)
+grade_ns.add_model(grading_scale_input.name, grading_scale_input)
+grade_ns.add_model(grading_scale_model.name, grading_scale_model)
+
+MAX_SCORE_SHEET_ROWS = 5000
+
+
+def validate_grading_bands(bands):
+    """
+    Return an error message if the bands do not make a usable grading scale
+    """
+    min_scores = [band["min_score"] for band in bands]
+    if any(band["letter"] not in GRADE_POINTS for band in bands):
+        return f"Letter grades must be one of: {', '.join(GRADE_POINTS)}"
+    if len(set(min_scores)) != len(min_scores):
+        return "Each band must have a different min_score"
+    if min(min_scores) != 0:
+        return "The lowest band must start at a min_score of 0"
+    return None
+
+
+def parse_student_id(value):
+    """
+    Get the student ID of a score sheet row: a whole number from JSON or a
+    string of digits from CSV. Returns None when it is left out and raises
+    ValueError for anything else, such as booleans and fractions.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().isascii() and value.strip().isdigit():
+        return int(value)
+    raise ValueError(f"Invalid student ID: {value!r}")
+
+
+@grade_ns.route("/scales")
+class GradingScaleListCreate(Resource):
+
+    @grade_ns.doc(description="Get the default grading scale and every course override")
+    @jwt_required()
+    def get(self):
+        """
+        Get all grading scales
+        """
+        scales = GradingScale.query.order_by(GradingScale.id).all()
+        return marshal(scales, grading_scale_model), HTTPStatus.OK
+
+    @grade_ns.expect(grading_scale_input, validate=True)
+    @grade_ns.doc(
+        description="Add the default grading scale (no course_id) or a course override"
+    )
+    @admin_required()
+    def post(self):
+        """
+        Add a grading scale
+        """
+        data = grade_ns.payload
+        course_id = data.get("course_id")
+        bands = data["bands"]
+
+        error_msg = validate_grading_bands(bands)
+        if error_msg:
+            abort(400, message=error_msg)
+
+        if course_id is not None:
+            Course.query.get_or_404(course_id)
+
+        existing = GradingScale.query.filter(
+            GradingScale.course_id.is_(None) if course_id is None
+            else GradingScale.course_id == course_id
+        ).first()
+        if existing is not None:
+            abort(400, message="This grading scale already exists, update it instead")
+
+        scale = GradingScale(course_id=course_id, bands=bands)
+        scale.save()
+        grade_ns.logger.info(f"Created grading scale: {scale}")
+        return marshal(scale, grading_scale_model), HTTPStatus.CREATED
+
+
+@grade_ns.route("/scales/<int:scale_id>")
+class GradingScaleUpdateDelete(Resource):
+
+    @grade_ns.expect(grading_scale_input, validate=True)
+    @grade_ns.doc(
+        description="Replace the bands of a grading scale",
+        params={"scale_id": "The ID of the grading scale"},
+    )
+    @admin_required()
+    def put(self, scale_id):
+        """
+        Update a grading scale
+        """
+        scale = GradingScale.query.get_or_404(scale_id)
+        bands = grade_ns.payload["bands"]
+
+        error_msg = validate_grading_bands(bands)
+        if error_msg:
+            abort(400, message=error_msg)
+
+        scale.bands = bands
+        scale.commit_update()
+        return marshal(scale, grading_scale_model), HTTPStatus.OK
+
+    @grade_ns.doc(
+        description="Delete a grading scale", params={"scale_id": "The ID of the grading scale"}
+    )
+    @admin_required()
+    def delete(self, scale_id):
+        """
+        Delete a grading scale
+        """
+        scale = GradingScale.query.get_or_404(scale_id)
+        scale.delete()
+        return None, HTTPStatus.NO_CONTENT
+
+
+@grade_ns.route("/export")
+class GradeExport(Resource):
+
+    @grade_ns.doc(description="Export every grade as NDJSON or CSV")
+    @grade_ns.expect(export_parser)
+    @admin_required()
+    def get(self):
+        """
+        Export all grades
+        """
+        args = export_parser.parse_args()
+        query = Grade.query.order_by(Grade.student_id, Grade.course_id)
+        return stream_export(query, grade_model, args["format"], "grades")
 
 
 @grade_ns.route("/<int:student_id>/<int:course_id>")
@@ -67,14 +215,13 @@ class GradeRetrieveUpdate(Resource):
             abort(403, message="Only the course teacher can perform this action")
 
         # Check that the student is registered to the course before grading
-        if student not in course.students:
+        if not course.has_student(student.id):
             abort(400, message="This student did not register for this course")
 
         try:
             grade = Grade(student_id=student_id, course_id=course_id, score=score)
             grade.allocate_letter_grade()
             grade.save()
-            student.calculate_student_gpa()
             grade_ns.logger.info("Grading student")
             return marshal(grade, grade_model), HTTPStatus.CREATED
 
@@ -98,7 +245,6 @@ class GradeRetrieveUpdate(Resource):
         data = grade_ns.payload
 
         course = Course.query.get_or_404(course_id)
-        student = Student.query.get_or_404(student_id)
         current_user = get_current_user()
 
         if course.teacher != current_user:
@@ -108,6 +254,125 @@ class GradeRetrieveUpdate(Resource):
         grade = Grade.query.get_or_404((student_id, course_id))
         grade.score = data.get("score", grade.score)
         grade.allocate_letter_grade()
-        student.calculate_student_gpa()
         grade.commit_update()
         return marshal(grade, grade_model), HTTPStatus.OK
+
+
+@grade_ns.route("/<int:course_id>/bulk")
+class GradeBulkUpload(Resource):
+
+    @grade_ns.expect([bulk_score_input])
+    @grade_ns.doc(
+        description="Grade many students in a course at once from a JSON array or a CSV "
+                    "file with a student_id or school_id column and a score column",
+        params={"course_id": "The ID of the course"},
+    )
+    @staff_required()
+    def post(self, course_id):
+        """
+        Upload the score sheet of a course
+        """
+        course = Course.query.get_or_404(course_id)
+        current_user = get_current_user()
+
+        if course.teacher != current_user:
+            grade_ns.logger.warn(f"Unauthorized access: {current_user}")
+            abort(403, message="Only the course teacher can perform this action")
+
+        if request.mimetype == "text/csv":
+            rows = list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+        else:
+            rows = request.get_json(silent=True)
+
+        if not isinstance(rows, list) or not rows:
+            abort(400, message="Provide a JSON array or a CSV file of scores")
+        if len(rows) > MAX_SCORE_SHEET_ROWS:
+            abort(400, message=f"Upload at most {MAX_SCORE_SHEET_ROWS} scores at a time")
+
+        errors = []
+        sheet = []
+        for row_number, row in enumerate(rows, start=1):
+            try:
+                score = float(row["score"])
+                student_id = row.get("student_id")
+                school_id = row.get("school_id") or None
+            except (AttributeError, KeyError, TypeError, ValueError):
+                errors.append({"row": row_number, "message": "Provide a numeric score"})
+                continue
+            try:
+                student_id = parse_student_id(student_id)
+            except ValueError:
+                errors.append({"row": row_number, "message": "student_id must be a whole number"})
+                continue
+
+            if not 0.0 <= score <= 100.0:
+                errors.append({"row": row_number, "message": "Score must be between 0 and 100"})
+            elif (student_id is None) == (school_id is None):
+                errors.append({"row": row_number, "message": "Provide a student_id or a school_id"})
+            else:
+                sheet.append((row_number, student_id, school_id, score))
+
+        # Resolve school IDs and enrolments with one query each
+        school_ids = {school_id for _, _, school_id, _ in sheet if school_id}
+        ids_by_school_id = dict(
+            db.session.query(Student.school_id, Student.id).filter(Student.school_id.in_(school_ids))
+        ) if school_ids else {}
+        student_ids = {
+            student_id or ids_by_school_id.get(school_id)
+            for _, student_id, school_id, _ in sheet
+        }
+        enrolled = set(db.session.scalars(
+            select(enrollment.c.student_id).where(
+                enrollment.c.course_id == course.id,
+                enrollment.c.student_id.in_(student_ids),
+            )
+        ))
+
+        graded = {}
+        for row_number, student_id, school_id, score in sheet:
+            student_id = student_id or ids_by_school_id.get(school_id)
+            if student_id not in enrolled:
+                errors.append({
+                    "row": row_number,
+                    "message": "This student did not register for this course",
+                })
+            elif student_id in graded:
+                errors.append({
+                    "row": row_number,
+                    "message": "This student appears more than once",
+                })
+            else:
+                graded[student_id] = (row_number, score)
+
+        errors.sort(key=lambda error: error["row"])
+        if not graded:
+            return {"graded": [], "errors": errors}, HTTPStatus.BAD_REQUEST
+
+        scale = get_grading_scale(course.id)
+        letters = scale.letters_for([score for _, score in graded.values()])
+        grades = [
+            {"student_id": student_id, "course_id": course.id, "score": score, "letter_grade": letter}
+            for (student_id, (_, score)), letter in zip(graded.items(), letters)
+        ]
+
+        # Insert or update every grade, then recompute the students' GPA totals from their
+        # grades, so that overlapping uploads of the same sheet cannot count a course twice
+        statement = sqlite_insert(Grade.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=["student_id", "course_id"],
+            set_={
+                "score": statement.excluded.score,
+                "letter_grade": statement.excluded.letter_grade,
+                "version": Grade.__table__.c.version + 1,
+            },
+        )
+        db.session.execute(statement, grades)
+
+        recompute_grade_totals(db.session.connection(), Student.__table__.c.id.in_(graded))
+        Grade.commit_update()
+
+        grade_ns.logger.info(f"Graded {len(grades)} students in {course}")
+        results = [
+            dict(grade, row=graded[grade["student_id"]][0]) for grade in grades
+        ]
+        return {"graded": results, "errors": errors}, HTTPStatus.CREATED
@@ -1,13 +1,37 @@
+import csv
+import io
 from http import HTTPStatus
 
+from flask import request
 from flask_jwt_extended import jwt_required
-from flask_restx import Namespace, Resource, abort, marshal
+from flask_restx import Namespace, Resource, abort
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
 
-from ..models.grades import Grade
+from ..models.courses import enrollment
+from ..database import db
+from ..models.identities import Identity, identity_rows
 from ..models.students import Student
-from ..serializers.users import user_input_model, student_model
-from ..util import admin_required, is_student_or_admin, is_valid_email
-
+from ..models.users import default_password_hash
+from ..serializers.export import export_parser
+from ..serializers.marshalling import marshal
+from ..serializers.users import student_list_parser, student_model, user_input_model
+from ..util import (
+    admin_required,
+    conditional_response,
+    email_in_use,
+    get_user_or_404,
+    is_student_or_admin,
+    is_valid_email,
+    paginated_response,
+    prefix_filter,
+    stream_export,
+    validate_emails,
+)
+
+
+DEFAULT_PASSWORD = "password123"
+MAX_IMPORT_ROWS = 10000
 
 student_ns = Namespace("Students", "The student namespace")
 student_ns.add_model(user_input_model.name, user_input_model)
@@ -17,14 +41,28 @@ student_ns.add_model(student_model.name, student_model)
 @student_ns.route("/")
 class StudentListCreate(Resource):
 
-    @student_ns.doc(description="Get all students")
+    @student_ns.doc(description="Get all students, a page at a time")
+    @student_ns.expect(student_list_parser)
     @admin_required()
     def get(self):
         """
         Get all students
         """
-        all_students = Student.query.all()
-        return marshal(all_students, student_model), HTTPStatus.OK
+        args = student_list_parser.parse_args()
+        query = Student.query
+
+        if args["school_id"]:
+            query = query.filter(prefix_filter(Student.school_id, args["school_id"]))
+        if args["min_gpa"] is not None:
+            query = query.filter(Student.gpa >= args["min_gpa"])
+        if args["max_gpa"] is not None:
+            query = query.filter(Student.gpa <= args["max_gpa"])
+        if args["course_id"] is not None:
+            query = query.join(enrollment, enrollment.c.student_id == Student.id).filter(
+                enrollment.c.course_id == args["course_id"]
+            )
+
+        return paginated_response(query, student_model, args, [Student.id]), HTTPStatus.OK
 
     @student_ns.doc(description="Create a new student")
     @student_ns.expect(user_input_model, validate=True)
@@ -48,21 +86,159 @@ class StudentListCreate(Resource):
         if len(name) <= 1:
             error_msg = "Provide your first name and last name"
 
-        student = Student.find_by_email(email_address)
-        if student is not None:
-            error_msg = f"Student with email address: {email_address} already exists"
+        if email_in_use(email_address):
+            error_msg = f"User with email address: {email_address} already exists"
 
         # Create a new student and set a default password if no error message else abort
         if error_msg:
             abort(400, message=error_msg)
 
-        default_password = "password123"
-        new_student = Student(full_name, email_address, default_password)
+        password_hash = default_password_hash(DEFAULT_PASSWORD)
+        new_student = Student(full_name, email_address, password_hash=password_hash)
         new_student.save()
         student_ns.logger.info(f"Created new Student: {new_student}")
         return marshal(new_student, student_model), HTTPStatus.CREATED
 
 
+@student_ns.route("/bulk")
+class StudentBulkCreate(Resource):
+
+    @student_ns.doc(
+        description="Create many students at once from a JSON array or a CSV file "
+                    "with full_name and email_address columns"
+    )
+    @student_ns.expect([user_input_model])
+    @admin_required()
+    def post(self):
+        """
+        Create students in bulk
+        """
+        if request.mimetype == "text/csv":
+            rows = list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+        else:
+            rows = request.get_json(silent=True)
+
+        if not isinstance(rows, list) or not rows:
+            abort(400, message="Provide a JSON array or a CSV file of students")
+        if len(rows) > MAX_IMPORT_ROWS:
+            abort(400, message=f"Import at most {MAX_IMPORT_ROWS} students at a time")
+
+        errors = []
+        valid_rows = []
+        seen_emails = set()
+
+        # Validate every row before touching the database
+        cleaned_rows = []
+        for row_number, row in enumerate(rows, start=1):
+            if not isinstance(row, dict):
+                errors.append({"row": row_number, "message": "Expected an object"})
+                continue
+            full_name = row.get("full_name") or ""
+            email_address = row.get("email_address") or ""
+            if not (isinstance(full_name, str) and isinstance(email_address, str)):
+                errors.append({"row": row_number, "message": "full_name and email_address must be strings"})
+                continue
+            full_name, email_address = full_name.strip(), email_address.strip()
+            cleaned_rows.append((row_number, full_name, email_address))
+
+        email_checks = validate_emails(email_address for _, _, email_address in cleaned_rows)
+
+        for row_number, full_name, email_address in cleaned_rows:
+            error_msg = None
+            if len(full_name.split()) <= 1:
+                error_msg = "Provide your first name and last name"
+
+            valid = email_checks[email_address]
+            if valid != True:
+                error_msg = f"Invalid Email address: {valid}"
+            elif email_address in seen_emails:
+                error_msg = f"Email address: {email_address} appears more than once"
+
+            if error_msg:
+                errors.append({"row": row_number, "message": error_msg})
+                continue
+
+            seen_emails.add(email_address)
+            valid_rows.append((row_number, full_name, email_address))
+
+        # Look up every email address that is already taken with a single query
+        existing = Identity.find_taken(seen_emails)
+
+        password_hash = default_password_hash(DEFAULT_PASSWORD)
+        new_students = []
+        for row_number, full_name, email_address in valid_rows:
+            if email_address in existing:
+                errors.append({
+                    "row": row_number,
+                    "message": f"User with email address: {email_address} already exists",
+                })
+                continue
+
+            new_students.append({
+                "row": row_number,
+                "full_name": full_name,
+                "email_address": email_address,
+                "password_hash": password_hash,
+                "role": "STUDENT",
+            })
+
+        errors.sort(key=lambda error: error["row"])
+        if not new_students:
+            return {"created": [], "errors": errors}, HTTPStatus.BAD_REQUEST
+
+        # Reserve the school IDs of every new student at once
+        school_ids = Student.generate_school_ids([row["full_name"] for row in new_students])
+        for row, school_id in zip(new_students, school_ids):
+            row["school_id"] = school_id
+
+        # Insert every new student in one batched statement and transaction
+        try:
+            db.session.execute(
+                insert(Student),
+                [{key: value for key, value in row.items() if key != "row"} for row in new_students],
+            )
+            # Bulk inserts skip mapper events, so add the new identities here
+            inserted = db.session.execute(
+                select(Student.id, Student.email_address, Student.school_id)
+                .where(Student.school_id.in_(school_ids))
+            )
+            db.session.execute(
+                insert(Identity),
+                [
+                    identity_row
+                    for user_id, email_address, school_id in inserted
+                    for identity_row in identity_rows("STUDENT", user_id, email_address, school_id)
+                ],
+            )
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            student_ns.logger.error(e)
+            abort(409, message="Some of these students were created at the same time, try again")
+
+        created = [
+            {"row": row["row"], "email_address": row["email_address"], "school_id": row["school_id"]}
+            for row in new_students
+        ]
+        student_ns.logger.info(f"Imported {len(created)} students")
+        return {"created": created, "errors": errors}, HTTPStatus.CREATED
+
+
+@student_ns.route("/export")
+class StudentExport(Resource):
+
+    @student_ns.doc(description="Export every student as NDJSON or CSV")
+    @student_ns.expect(export_parser)
+    @admin_required()
+    def get(self):
+        """
+        Export all students
+        """
+        args = export_parser.parse_args()
+        query = Student.query.order_by(Student.id)
+        return stream_export(query, student_model, args["format"], "students")
+
+
 @student_ns.route("/<int:student_id>")
 class StudentRetrieveUpdateDelete(Resource):
 
@@ -75,7 +251,7 @@ class StudentRetrieveUpdateDelete(Resource):
         """
         Retrieve a student
         """
-        student = Student.query.get_or_404(student_id)
+        student = get_user_or_404(Student, student_id)
 
         # Allow access to the student or the admin
         if not is_student_or_admin(student_id):
@@ -95,11 +271,15 @@ class StudentRetrieveUpdateDelete(Resource):
         """
         data = student_ns.payload
 
-        valid = is_valid_email(data.get("email_address"))
-        if valid != True:
-            abort(400, message=f"Invalid Email address: {valid}")
+        if "email_address" in data:
+            valid = is_valid_email(data["email_address"])
+            if valid != True:
+                abort(400, message=f"Invalid Email address: {valid}")
+
+        student = get_user_or_404(Student, student_id)
+        if email_in_use(data.get("email_address"), student):
+            abort(400, message=f"User with email address: {data['email_address']} already exists")
 
-        student = Student.query.get_or_404(student_id)
         student.full_name = data.get("full_name", student.full_name)
         student.email_address = data.get("email_address", student.email_address)
         student.commit_update()
@@ -114,7 +294,7 @@ class StudentRetrieveUpdateDelete(Resource):
         """
         Delete a student
         """
-        student = Student.query.get_or_404(student_id)
+        student = get_user_or_404(Student, student_id)
         student.delete()
         return None, HTTPStatus.NO_CONTENT
 
@@ -131,7 +311,7 @@ class StudentCoursesRetrieve(Resource):
         """
         Get a student's registered courses
         """
-        student = Student.query.get_or_404(student_id)
+        student = get_user_or_404(Student, student_id)
 
         if not is_student_or_admin(student_id):
             abort(403, message="You don't have rights to access this resource")
@@ -157,21 +337,15 @@ class StudentResultRetrieve(Resource):
         """
         Get a student's result
         """
-        student = Student.query.get_or_404(student_id)
+        version = db.first_or_404(select(Student.version).where(Student.id == student_id))
 
         if not is_student_or_admin(student_id):
             abort(403, message="You don't have rights to access this resource")
 
-        results = {}
-        course_results = []
-        student_ns.logger.debug(f"Calculating student: {student.school_id} GPA")
-
-        for course in student.courses:
-            grade = Grade.query.get((student.id, course.id))
-            result = {"course_title": course.title, "grade": grade.letter_grade}
-            course_results.append(result)
-
-        results["course_results"] = course_results
-        results["GPA"] = student.calculate_student_gpa()
+        def build():
+            # Read only: the stored GPA is kept up to date by the grading endpoints
+            student = get_user_or_404(Student, student_id)
+            course_results, gpa = student.get_transcript()
+            return {"result": {"course_results": course_results, "GPA": gpa}}
 
-        return {"result": results}, HTTPStatus.OK
+        return conditional_response(("result", student_id, version), build)
@@ -1,11 +1,25 @@
 from http import HTTPStatus
 
-from flask_restx import Namespace, Resource, abort, marshal
+from flask_restx import Namespace, Resource, abort
 from flask_jwt_extended import jwt_required
 
 from ..models.teachers import Teacher
+from ..models.users import default_password_hash
+from ..serializers.export import export_parser
+from ..serializers.marshalling import marshal
+from ..serializers.pagination import pagination_parser
 from ..serializers.users import teacher_model, user_input_model
-from ..util import admin_required, is_teacher_or_admin, is_valid_email
+from ..util import (
+    admin_required,
+    email_in_use,
+    get_user_or_404,
+    is_teacher_or_admin,
+    is_valid_email,
+    paginated_response,
+    stream_export,
+)
+
+DEFAULT_PASSWORD = "teacherpassword123"
 
 teacher_ns = Namespace("Teachers", "The teacher namespace")
 teacher_ns.add_model(user_input_model.name, user_input_model)
@@ -15,14 +29,15 @@ teacher_ns.add_model(teacher_model.name, teacher_model)
 @teacher_ns.route("/")
 class TeacherListCreate(Resource):
 
-    @teacher_ns.doc(description="Get all teachers")
+    @teacher_ns.doc(description="Get all teachers, a page at a time")
+    @teacher_ns.expect(pagination_parser)
     @admin_required()
     def get(self):
         """
         Get all teachers
         """
-        all_teachers = Teacher.query.all()
-        return marshal(all_teachers, teacher_model), HTTPStatus.OK
+        args = pagination_parser.parse_args()
+        return paginated_response(Teacher.query, teacher_model, args, [Teacher.id]), HTTPStatus.OK
 
     @teacher_ns.expect(user_input_model, validate=True)
     @teacher_ns.doc(description="Create a teacher")
@@ -45,20 +60,34 @@ class TeacherListCreate(Resource):
         if len(name) <= 1:
             error_msg = "Provide your first name and last name"
 
-        teacher = Teacher.find_by_email(email_address)
-        if teacher is not None:
-            error_msg = f"Teacher with email address: {email_address} already exists"
+        if email_in_use(email_address):
+            error_msg = f"User with email address: {email_address} already exists"
 
         if error_msg:
             abort(400, message=error_msg)
 
-        default_password = "teacherpassword123"
-        new_teacher = Teacher(full_name, email_address, default_password)
+        password_hash = default_password_hash(DEFAULT_PASSWORD)
+        new_teacher = Teacher(full_name, email_address, password_hash=password_hash)
         new_teacher.save()
         teacher_ns.logger.info(f"Created new Teacher: {new_teacher}")
         return marshal(new_teacher, teacher_model), HTTPStatus.CREATED
 
 
+@teacher_ns.route("/export")
+class TeacherExport(Resource):
+
+    @teacher_ns.doc(description="Export every teacher as NDJSON or CSV")
+    @teacher_ns.expect(export_parser)
+    @admin_required()
+    def get(self):
+        """
+        Export all teachers
+        """
+        args = export_parser.parse_args()
+        query = Teacher.query.order_by(Teacher.id)
+        return stream_export(query, teacher_model, args["format"], "teachers")
+
+
 @teacher_ns.route("/<int:teacher_id>")
 class TeacherRetrieveUpdateDelete(Resource):
 
@@ -71,7 +100,7 @@ class TeacherRetrieveUpdateDelete(Resource):
         """
         Retrieve a teacher
         """
-        teacher = Teacher.query.get_or_404(teacher_id)
+        teacher = get_user_or_404(Teacher, teacher_id)
 
         # Grant access to teacher or admin
         if not is_teacher_or_admin(teacher_id):
@@ -91,11 +120,15 @@ class TeacherRetrieveUpdateDelete(Resource):
         """
         data = teacher_ns.payload
 
-        valid = is_valid_email(data.get("email_address"))
-        if valid != True:
-            abort(400, message=f"Invalid Email address: {valid}")
+        if "email_address" in data:
+            valid = is_valid_email(data["email_address"])
+            if valid != True:
+                abort(400, message=f"Invalid Email address: {valid}")
+
+        teacher = get_user_or_404(Teacher, teacher_id)
+        if email_in_use(data.get("email_address"), teacher):
+            abort(400, message=f"User with email address: {data['email_address']} already exists")
 
-        teacher = Teacher.query.get_or_404(teacher_id)
         teacher.full_name = data.get("full_name", teacher.full_name)
         teacher.email_address = data.get("email_address", teacher.email_address)
         teacher.commit_update()
@@ -109,6 +142,6 @@ class TeacherRetrieveUpdateDelete(Resource):
         """
         Delete a teacher
         """
-        teacher = Teacher.query.get_or_404(teacher_id)
+        teacher = get_user_or_404(Teacher, teacher_id)
         teacher.delete()
         return None, HTTPStatus.NO_CONTENT
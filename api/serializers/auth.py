@@ -1,6 +1,8 @@
-from flask_restx import Model, fields
+from flask_restx import fields
 
-login_model = Model(
+from .validation import CompiledModel
+
+login_model = CompiledModel(
     "Login model",
     {
         "school_id": fields.String(),
@@ -8,4 +10,4 @@ login_model = Model(
         "password": fields.String(required=True),
     },
 )
-new_password_input = Model("New password", {"new_password": fields.String(required=True)})
+new_password_input = CompiledModel("New password", {"new_password": fields.String(required=True)})
@@ -1,9 +1,11 @@
 from flask_restx import Model, fields
 
 from ..serializers import users
+from .pagination import pagination_parser
+from .validation import CompiledModel
 
 
-course_input_model = Model(
+course_input_model = CompiledModel(
     "Course Input Model",
     {
         "title": fields.String(required=True),
@@ -24,15 +26,36 @@ course_output_model = Model(
     },
 )
 
-course_students_model = course_output_model.clone(
-    "Course with registered students",
-    {"students": fields.Nested(users.student_model, as_list=True)},
+course_detail_model = course_output_model.clone(
+    "Course details",
+    {"student_count": fields.Integer(description="How many students are enrolled")},
 )
 
-course_register_model = Model(
+course_register_model = CompiledModel(
     "Course Register Model",
     {
         "course_title": fields.String(required=True),
         "school_id": fields.String(required=True),
     },
 )
+
+batch_register_model = CompiledModel(
+    "Batch Course Register Model",
+    {
+        "school_id": fields.String(description="Enrol this student in every course_titles"),
+        "course_titles": fields.List(fields.String),
+        "course_title": fields.String(description="Enrol every school_ids in this course"),
+        "school_ids": fields.List(fields.String),
+    },
+)
+
+course_list_parser = pagination_parser.copy()
+course_list_parser.add_argument(
+    "teacher_id", type=int, location="args", help="Only courses taught by this teacher"
+)
+
+course_students_parser = pagination_parser.copy()
+course_students_parser.add_argument(
+    "sort", choices=("name", "school_id"), default="name", location="args",
+    help="Order the students by full name or school ID",
+)
@@ -0,0 +1,12 @@
+from flask_restx import reqparse
+
+
+export_parser = reqparse.RequestParser()
+export_parser.add_argument(
+    "format",
+    type=str,
+    choices=("ndjson", "csv"),
+    default="ndjson",
+    location="args",
+    help="Newline-delimited JSON or CSV",
+)
@@ -1,5 +1,7 @@
 from flask_restx import Model, fields
 
+from .validation import CompiledModel
+
 
 grade_model = Model(
     "Grade model",
@@ -11,6 +13,40 @@ grade_model = Model(
     },
 )
 
-score_input = Model("Score", {
+score_input = CompiledModel("Score", {
     "score": fields.Float(required=True, min=0.0, max=100.0)
 })
+
+bulk_score_input = CompiledModel(
+    "Bulk score",
+    {
+        "student_id": fields.Integer(description="The student ID, or give their school_id"),
+        "school_id": fields.String(),
+        "score": fields.Float(required=True, min=0.0, max=100.0),
+    },
+)
+
+grading_band_model = CompiledModel(
+    "Grading band",
+    {
+        "letter": fields.String(required=True),
+        "min_score": fields.Integer(required=True, min=0, max=100),
+    },
+)
+
+grading_scale_input = CompiledModel(
+    "Grading scale input",
+    {
+        "course_id": fields.Integer(description="Leave out for the school default scale"),
+        "bands": fields.List(fields.Nested(grading_band_model), required=True, min_items=1),
+    },
+)
+
+grading_scale_model = Model(
+    "Grading scale",
+    {
+        "id": fields.Integer(),
+        "course_id": fields.Integer(),
+        "bands": fields.List(fields.Nested(grading_band_model)),
+    },
+)
@@ -0,0 +1,216 @@
+from flask_restx import fields, marshal as restx_marshal
+from flask_restx.model import instance
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+
+
+# Per-value conversions of the scalar fields, matching their `format` methods
+SCALAR_FORMATS = {
+    fields.Raw: None,
+    fields.String: str,
+    fields.Integer: int,
+    fields.Float: float,
+    fields.Boolean: bool,
+}
+
+
+class UnsupportedModel(Exception):
+    """
+    Raised for models the compiler does not handle, which keep using flask-restx
+    """
+
+
+def marshal(data, model):
+    """
+    Drop-in replacement for `flask_restx.marshal(data, model)` that runs the
+    model's compiled serializer on ORM objects and result rows.
+    """
+    serialize = get_serializer(model)
+    if serialize is None:
+        return restx_marshal(data, model)
+    if isinstance(data, (list, tuple)):
+        return [restx_marshal(item, model) if type(item) is dict else serialize(item) for item in data]
+    if type(data) is dict:
+        return restx_marshal(data, model)
+    return serialize(data)
+
+
+def get_serializer(model):
+    """
+    Get the compiled serializer of a model, compiling it the first time
+    """
+    serialize = model.__dict__.get("_compiled_serializer")
+    if serialize is None:
+        try:
+            serialize = compile_serializer(model)
+        except UnsupportedModel:
+            serialize = False
+        model._compiled_serializer = serialize
+    return serialize or None
+
+
+def compile_serializer(model):
+    """
+    Generate a function that builds a model's output dict from an object's
+    attributes in one pass, giving the same result as flask-restx's marshal.
+    Nested models and lists are compiled the same way.
+    """
+    if getattr(model, "__mask__", None) or model.__parents__:
+        raise UnsupportedModel(model.name)
+
+    namespace = {}
+    lines = ["def serialize(obj):"]
+    entries = []
+    for i, (key, field) in enumerate(model.items()):
+        field = instance(field)
+        lines.append(f"    v{i} = getattr(obj, {field_attribute(key, field)!r}, None)")
+        fmt = SCALAR_FORMATS.get(type(field), False)
+        if fmt is None:
+            entries.append(f"{key!r}: v{i}")
+        elif fmt:
+            namespace[f"c{i}"] = fmt
+            entries.append(f"{key!r}: None if v{i} is None else c{i}(v{i})")
+        else:
+            namespace[f"f{i}"] = compile_value(field)
+            entries.append(f"{key!r}: f{i}(v{i})")
+    lines.append("    return {" + ", ".join(entries) + "}")
+
+    exec("\n".join(lines), namespace)
+    return namespace["serialize"]
+
+
+def field_attribute(key, field):
+    attribute = key if field.attribute is None else field.attribute
+    if not isinstance(attribute, str) or "." in attribute:
+        raise UnsupportedModel(key)
+    if field.default is not None or getattr(field, "mask", None):
+        raise UnsupportedModel(key)
+    return attribute
+
+
+def compile_value(field):
+    """
+    Compile the output of a nested or list field from the value it was given
+    """
+    if type(field) is fields.Nested:
+        if field.default is not None:
+            raise UnsupportedModel(field.nested.name)
+        model = field.nested
+        serialize = compile_serializer(model)
+        allow_null = field.allow_null
+
+        def nested(value):
+            if value is None and allow_null:
+                return None
+            if isinstance(value, (list, tuple)):
+                return [restx_marshal(item, model) if type(item) is dict else serialize(item) for item in value]
+            if type(value) is dict:
+                return restx_marshal(value, model)
+            return serialize(value)
+
+        return nested
+
+    if type(field) is fields.List:
+        container = field.container
+        if container.attribute is not None or container.default is not None:
+            raise UnsupportedModel(field)
+        fmt = SCALAR_FORMATS.get(type(container), False)
+        if fmt is False:
+            item_value = compile_value(container)
+        elif fmt is None:
+            item_value = lambda item: item
+        else:
+            item_value = lambda item: None if item is None else fmt(item)
+
+        def list_value(value):
+            if value is None:
+                return None
+            if isinstance(value, (list, tuple, set)):
+                return [item_value(item) for item in value]
+            # Anything else takes flask-restx's own path
+            attribute = field.attribute or "value"
+            return field.output(attribute, {attribute: value})
+
+        return list_value
+
+    raise UnsupportedModel(field)
+
+
+def prepare_query(query, model):
+    """
+    Shape a query for one mapped class for marshalling its results with
+    `model`: rows of just the needed columns when the model is all columns,
+    or else objects with the relationships its nested fields follow loaded
+    up front.
+    """
+    columns_query = select_columns(query, model)
+    if columns_query is not query:
+        return columns_query
+    entity = query_entity(query)
+    if entity is None:
+        return query
+    return query.options(*eager_load_options(entity, model))
+
+
+def query_entity(query):
+    descriptions = query.column_descriptions
+    if len(descriptions) != 1:
+        return None
+    entity = descriptions[0]["entity"]
+    if entity is None or descriptions[0]["expr"] is not entity:
+        return None
+    return entity
+
+
+def eager_load_options(entity, model, parent=None):
+    """
+    Loader options for every relationship the nested fields of `model` read.
+    Many-to-one relationships are joined into the query and collections are
+    loaded with one extra SELECT ... IN query each, however many rows there are.
+    """
+    relationships = inspect(entity).relationships
+    options = []
+    for key, field in model.items():
+        field = instance(field)
+        if type(field) is fields.List:
+            field = instance(field.container)
+        if type(field) is not fields.Nested:
+            continue
+        attribute = key if field.attribute is None else field.attribute
+        if attribute not in relationships:
+            continue
+
+        relationship = relationships[attribute]
+        # Dynamic relationships are queries, not loaded collections
+        if relationship.lazy in ("dynamic", "write_only"):
+            continue
+        loader = selectinload if relationship.uselist else joinedload
+        relationship_attribute = getattr(entity, attribute)
+        option = (
+            loader(relationship_attribute) if parent is None
+            else getattr(parent, loader.__name__)(relationship_attribute)
+        )
+        options.append(option)
+        options.extend(eager_load_options(relationship.mapper.class_, field.nested, option))
+    return options
+
+
+def select_columns(query, model):
+    """
+    Make a query for one mapped class return rows of just the columns `model`
+    outputs, skipping ORM object loading. Queries the model needs objects for,
+    e.g. to follow relationships, are returned unchanged.
+    """
+    entity = query_entity(query)
+    if entity is None or get_serializer(model) is None:
+        return query
+
+    column_attrs = inspect(entity).column_attrs
+    columns = []
+    for key, field in model.items():
+        field = instance(field)
+        attribute = key if field.attribute is None else field.attribute
+        if type(field) not in SCALAR_FORMATS or attribute not in column_attrs:
+            return query
+        columns.append(getattr(entity, attribute))
+    return query.with_entities(*columns)
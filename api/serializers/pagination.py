@@ -0,0 +1,32 @@
+from flask_restx import inputs, reqparse
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def page_size(value):
+    value = int(value)
+    if not 1 <= value <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return value
+
+
+pagination_parser = reqparse.RequestParser()
+pagination_parser.add_argument(
+    "limit",
+    type=page_size,
+    default=DEFAULT_PAGE_SIZE,
+    location="args",
+    help=f"Number of items per page (max {MAX_PAGE_SIZE})",
+)
+pagination_parser.add_argument(
+    "cursor", type=str, location="args", help="The next_cursor of the previous page"
+)
+pagination_parser.add_argument(
+    "all",
+    type=inputs.boolean,
+    default=False,
+    location="args",
+    help="Return every item as a plain list instead of a page",
+)
@@ -1,7 +1,10 @@
 from flask_restx import Model, fields
 
+from .pagination import pagination_parser
+from .validation import CompiledModel
 
-user_input_model = Model(
+
+user_input_model = CompiledModel(
     "User Input Model",
     {
         "full_name": fields.String(required=True),
@@ -19,7 +22,7 @@ user_output_model = Model(
     },
 )
 
-signup_model = Model(
+signup_model = CompiledModel(
     "Sign up model",
     {
         "email_address": fields.String(required=True),
@@ -40,3 +43,13 @@ student_model = user_output_model.clone(
 )
 
 teacher_model = user_output_model.clone("Teacher model")
+
+student_list_parser = pagination_parser.copy()
+student_list_parser.add_argument(
+    "school_id", type=str, location="args", help="Only students whose school ID starts with this"
+)
+student_list_parser.add_argument("min_gpa", type=float, location="args")
+student_list_parser.add_argument("max_gpa", type=float, location="args")
+student_list_parser.add_argument(
+    "course_id", type=int, location="args", help="Only students enrolled in this course"
+)
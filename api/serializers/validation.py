@@ -0,0 +1,146 @@
+import re
+
+from flask_restx import Model, fields
+from flask_restx.model import instance
+from flask_restx.utils import not_none
+
+
+# Schema keywords that only document a field and never fail validation
+ANNOTATIONS = {"title", "description", "readOnly", "default", "example"}
+
+
+class UnsupportedSchema(Exception):
+    """
+    Raised for schemas the compiler does not handle, which keep using jsonschema
+    """
+
+
+class CompiledModel(Model):
+    """
+    Model whose payload validation is compiled into plain Python checks the
+    first time it is used, instead of building a jsonschema validator for
+    every request.
+
+    The compiled check only ever accepts payloads jsonschema would accept.
+    Anything it rejects is validated again by flask-restx, so invalid payloads
+    get exactly the same error response as before. Models using schema
+    keywords the compiler does not know always use flask-restx's validation.
+    """
+
+    def validate(self, data, resolver=None, format_checker=None):
+        check = self.__dict__.get("_compiled_check")
+        if check is None:
+            try:
+                check = compile_model(self)
+            except UnsupportedSchema:
+                check = False
+            self._compiled_check = check
+
+        if not (check and check(data)):
+            super().validate(data, resolver, format_checker)
+
+
+def compile_model(model):
+    if model.__parents__ or model.__mask__:
+        raise UnsupportedSchema(model.name)
+
+    checks = [(name, compile_field(field)) for name, field in model.items()]
+    required = [name for name, field in model.items() if instance(field).required]
+    names = set(model)
+    strict = model.__strict__
+
+    def check_model(data):
+        if type(data) is not dict:
+            return False
+        for name in required:
+            if name not in data:
+                return False
+        if strict and not names.issuperset(data):
+            return False
+        for name, check_value in checks:
+            if name in data and not check_value(data[name]):
+                return False
+        return True
+
+    return check_model
+
+
+def compile_field(field):
+    field = instance(field)
+    schema = not_none(field.__schema__)
+
+    if isinstance(field, fields.Nested):
+        if field.allow_null or schema.keys() - ANNOTATIONS - {"$ref", "type", "items"}:
+            raise UnsupportedSchema(field.nested.name)
+        check_nested = compile_model(field.nested)
+        if field.as_list:
+            return lambda value: type(value) is list and all(check_nested(item) for item in value)
+        return check_nested
+
+    if isinstance(field, fields.List):
+        return compile_array(schema, compile_field(field.container))
+
+    return compile_schema(schema)
+
+
+def compile_array(schema, check_item):
+    if schema.keys() - ANNOTATIONS - {"type", "items", "minItems", "maxItems"}:
+        raise UnsupportedSchema(schema)
+    min_items = schema.get("minItems", 0)
+    max_items = schema.get("maxItems")
+
+    def check_array(value):
+        if type(value) is not list or len(value) < min_items:
+            return False
+        if max_items is not None and len(value) > max_items:
+            return False
+        return all(check_item(item) for item in value)
+
+    return check_array
+
+
+def compile_schema(schema):
+    """
+    Compile the schema of a string, integer, number or boolean field
+    """
+    schema_type = schema.get("type")
+    checks = []
+
+    if schema_type == "string":
+        known = {"minLength", "maxLength", "pattern", "enum"}
+        checks.append(lambda value: isinstance(value, str))
+        if "minLength" in schema:
+            checks.append(lambda value, n=schema["minLength"]: len(value) >= n)
+        if "maxLength" in schema:
+            checks.append(lambda value, n=schema["maxLength"]: len(value) <= n)
+        if "pattern" in schema:
+            checks.append(lambda value, pattern=re.compile(schema["pattern"]): pattern.search(value))
+        if "enum" in schema:
+            checks.append(lambda value, enum=schema["enum"]: value in enum)
+
+    elif schema_type in ("integer", "number"):
+        known = {"minimum", "maximum"}
+        types = (int,) if schema_type == "integer" else (int, float)
+        checks.append(lambda value: isinstance(value, types) and not isinstance(value, bool))
+        if "minimum" in schema:
+            checks.append(lambda value, n=schema["minimum"]: value >= n)
+        if "maximum" in schema:
+            checks.append(lambda value, n=schema["maximum"]: value <= n)
+
+    elif schema_type == "boolean":
+        known = set()
+        checks.append(lambda value: isinstance(value, bool))
+
+    else:
+        raise UnsupportedSchema(schema)
+
+    if schema.keys() - ANNOTATIONS - known - {"type"}:
+        raise UnsupportedSchema(schema)
+
+    def check_value(value):
+        for check in checks:
+            if not check(value):
+                return False
+        return True
+
+    return check_value
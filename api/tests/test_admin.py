@@ -50,7 +50,8 @@ class AdminTestCase(TestCase):
         headers = self.generate_auth_header()
         response = self.client.get("api/v0/admin/", headers=headers)
         assert response.status_code == 200
-        assert isinstance(response.json, list)
+        assert isinstance(response.json["items"], list)
+        assert "next_cursor" in response.json
 
     def tests_on_single_admin(self):
         headers = self.generate_auth_header()
@@ -1,8 +1,19 @@
+import time
 from unittest import TestCase
 
+from flask_jwt_extended import create_access_token
+from jsonschema import Draft4Validator, RefResolver
+
 from .. import create_app
+from ..blocklist import BloomFilter, TokenBlocklist
+from ..passwords import PasswordHasher
+from ..serializers.auth import login_model
+from ..serializers.grades import grading_band_model, grading_scale_input, score_input
+from ..serializers.validation import compile_model
+from ..throttle import Throttle
 from ..database import db
-from ..models.users import Admin
+from ..models.tokens import RevokedToken
+from ..models.users import Admin, default_password_hash
 
 
 class AuthTestCase(TestCase):
@@ -62,4 +73,147 @@ class AuthTestCase(TestCase):
         headers = {"Authorization": f"Bearer {access_token}"}
         response = self.client.post("api/v0/auth/logout", headers=headers)
         assert response.status_code == 200
-        assert b'Token revoked' in response.data
\ No newline at end of file
+        assert b'Token revoked' in response.data
+    def test_revoked_token_is_rejected(self):
+        admin = Admin.find_by_email("testadmin@gmail.com")
+        access_token = create_access_token(identity=admin.id, additional_claims={"role": admin.role})
+        headers = {"Authorization": f"Bearer {access_token}"}
+        self.client.post("api/v0/auth/logout", headers=headers)
+        response = self.client.post("api/v0/auth/logout", headers=headers)
+        assert response.status_code == 401
+        assert response.json["message"] == "Token has been revoked"
+
+    def test_tokens_revoked_by_other_workers_sync(self):
+        blocklist = self.app.extensions["token_blocklist"]
+        jti = "revoked-by-another-worker"
+        assert not blocklist.is_revoked(jti)
+        db.session.add(RevokedToken(jti=jti, expires_at=int(time.time()) + 60))
+        db.session.commit()
+        blocklist.sync()
+        assert blocklist.is_revoked(jti)
+
+    def test_prune_expired_revoked_tokens(self):
+        blocklist = self.app.extensions["token_blocklist"]
+        now = int(time.time())
+        blocklist.revoke("expired-token", now - 60)
+        blocklist.revoke("live-token", now + 60)
+        assert blocklist.prune() >= 1
+        assert not blocklist.is_revoked("expired-token")
+        assert blocklist.is_revoked("live-token")
+        assert db.session.query(RevokedToken).filter_by(jti="expired-token").count() == 0
+
+    def test_revoked_token_ids_are_not_reused_after_prune(self):
+        blocklist = self.app.extensions["token_blocklist"]
+        other_worker = TokenBlocklist(self.app)
+        now = int(time.time())
+        blocklist.revoke("newest-expired-token", now - 60)
+        other_worker.sync()
+
+        # Pruning the newest row must not let the next revocation reuse its id
+        blocklist.prune()
+        blocklist.revoke("live-after-prune", now + 60)
+        other_worker.sync()
+        assert other_worker.is_revoked("live-after-prune")
+
+    def test_prune_swaps_in_a_filled_filter(self):
+        blocklist = self.app.extensions["token_blocklist"]
+        blocklist.revoke("kept-through-prune", int(time.time()) + 60)
+        blocklist.prune()
+        assert "kept-through-prune" in blocklist._filter
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(capacity=100)
+        items = [f"jti-{i}" for i in range(100)]
+        for item in items:
+            bloom.add(item)
+        assert all(item in bloom for item in items)
+        false_positives = sum(f"other-{i}" in bloom for i in range(1000))
+        assert false_positives < 20
+
+    def test_login_attempts_are_throttled(self):
+        Admin("Throttled Admin", "throttled@gmail.com", "password123").save()
+        self.app.extensions["login_identity_throttle"] = Throttle(rate=0.01, burst=2)
+        try:
+            data = {"email_address": "throttled@gmail.com", "password": "wrong-password"}
+            for _ in range(2):
+                response = self.client.post("api/v0/auth/login", json=data)
+                assert response.status_code == 400
+            response = self.client.post("api/v0/auth/login", json=dict(data, password="password123"))
+            assert response.status_code == 429
+            assert int(response.headers["Retry-After"]) > 0
+        finally:
+            self.app.extensions["login_identity_throttle"] = Throttle(rate=0, burst=0)
+
+    def test_password_is_rehashed_on_login(self):
+        Admin("Rehashed Admin", "rehashed@gmail.com", "password123").save()
+        hasher = self.app.extensions["password_hasher"]
+        self.app.extensions["password_hasher"] = PasswordHasher("pbkdf2:sha256:1000", max_workers=1)
+        try:
+            data = {"email_address": "rehashed@gmail.com", "password": "password123"}
+            response = self.client.post("api/v0/auth/login", json=data)
+            assert response.status_code == 200
+            db.session.expire_all()
+            assert Admin.find_by_email("rehashed@gmail.com").password_hash.startswith("pbkdf2:sha256:1000$")
+
+            response = self.client.post("api/v0/auth/login", json=data)
+            assert response.status_code == 200
+        finally:
+            self.app.extensions["password_hasher"] = hasher
+
+    def test_new_accounts_use_the_configured_hash_method(self):
+        hasher = self.app.extensions["password_hasher"]
+        self.app.extensions["password_hasher"] = PasswordHasher("pbkdf2:sha256:1000", max_workers=1)
+        self.app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:1000"
+        try:
+            data = {
+                "full_name": "Signed Up",
+                "email_address": "signedup@gmail.com",
+                "password": "password123",
+                "confirm_password": "password123",
+            }
+            assert self.client.post("api/v0/admin/signup", json=data).status_code == 201
+            created = Admin("Created Admin", "createdadmin@gmail.com", "password123")
+            for password_hash in (
+                Admin.find_by_email("signedup@gmail.com").password_hash,
+                created.password_hash,
+                default_password_hash("password123"),
+            ):
+                assert password_hash.startswith("pbkdf2:sha256:1000$")
+                assert not self.app.extensions["password_hasher"].needs_rehash(password_hash)
+        finally:
+            self.app.extensions["password_hasher"] = hasher
+            self.app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256"
+
+    def test_login_is_shed_when_hashing_is_saturated(self):
+        hasher = self.app.extensions["password_hasher"]
+        busy_hasher = PasswordHasher(max_workers=1, max_pending=0)
+        busy_hasher._in_flight = 1
+        self.app.extensions["password_hasher"] = busy_hasher
+        try:
+            data = {"email_address": "testadmin@gmail.com", "password": "password123"}
+            response = self.client.post("api/v0/auth/login", json=data)
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == "1"
+        finally:
+            self.app.extensions["password_hasher"] = hasher
+
+    def test_compiled_validation_matches_jsonschema(self):
+        resolver = RefResolver.from_schema(
+            {"definitions": {grading_band_model.name: grading_band_model.__schema__}}
+        )
+        values = [None, True, 0, 70, 100.5, "", "ALT/A1/2026", [], [{"letter": "A", "min_score": 70}],
+                  [{"letter": "A"}], [{"letter": "A", "min_score": 70.0}], {}]
+        for model in (login_model, score_input, grading_scale_input):
+            check = compile_model(model)
+            validator = Draft4Validator(model.__schema__, resolver=resolver)
+            for key in model:
+                for value in values:
+                    data = {name: "password123" for name in model if name != key}
+                    data[key] = value
+                    assert check(data) == validator.is_valid(data), (model.name, data)
+
+    def test_invalid_payload_error_is_unchanged(self):
+        response = self.client.post("api/v0/auth/login", json={"email_address": "testadmin@gmail.com"})
+        assert response.status_code == 400
+        assert response.json["message"] == "Input payload validation failed"
+        assert response.json["errors"] == {"password": "'password' is a required property"}
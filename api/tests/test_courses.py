@@ -1,10 +1,22 @@
+import json
 from unittest import TestCase
 
+from flask_restx import marshal as restx_marshal
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
 from api import create_app
 from ..database import db
 from ..models.users import Admin
 from ..models.students import Student
-from ..models.courses import Course
+from ..models.courses import Course, enrollment
+from ..models.grades import Grade
+from ..models.teachers import Teacher
+from ..serializers.courses import course_detail_model, course_output_model
+from ..serializers.grades import grade_model
+from ..serializers.marshalling import marshal, select_columns
+from ..serializers.users import student_model
 
 
 class CourseTestCase(TestCase):
@@ -44,7 +56,8 @@ class CourseTestCase(TestCase):
         headers = self.generate_auth_header()
         response = self.client.get("api/v0/courses/", headers=headers)
         assert response.status_code == 200
-        assert isinstance(response.json, list)
+        assert isinstance(response.json["items"], list)
+        assert "next_cursor" in response.json
 
     def tests_on_single_courses(self):
         headers = self.generate_auth_header()
@@ -88,6 +101,37 @@ class CourseTestCase(TestCase):
             in response.json.values()
         )
 
+    def test_register_twice_without_loading_roster(self):
+        headers = self.generate_auth_header()
+        student = Student.query.get(1)
+        data = {
+            "course_title": "Frontend Engineering",
+            "school_id": f"{student.school_id}",
+        }
+        statements = []
+
+        def record_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record_statement)
+        try:
+            response = self.client.post("api/v0/courses/enroll", json=data, headers=headers)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record_statement)
+
+        assert response.status_code == 400
+        assert b"This student already enrolled for Frontend Engineering" in response.data
+        assert not any("FROM student, enrollment" in statement for statement in statements)
+
+        # The enrollment table itself rejects duplicates
+        course = Course.get_by_title("Frontend Engineering")
+        try:
+            db.session.execute(enrollment.insert().values(course_id=course.id, student_id=student.id))
+        except IntegrityError:
+            db.session.rollback()
+        else:
+            raise AssertionError("Duplicate enrolment was accepted")
+
     def test_unregister_student_from_course(self):
         headers = self.generate_auth_header()
         student = Student.query.get(1)
@@ -97,3 +141,269 @@ class CourseTestCase(TestCase):
         }
         response = self.client.delete("api/v0/courses/enroll", json=data, headers=headers)
         assert response.status_code == 204
+
+    def test_batch_register(self):
+        headers = self.generate_auth_header()
+        Course("Batch One", "BA101", 2).save()
+        Course("Batch Two", "BA102", 2).save()
+        students = [
+            Student(f"Batch Student{i}", f"batchstudent{i}@gmail.com", "password123")
+            for i in range(3)
+        ]
+        for student in students:
+            student.save()
+
+        # One student, many courses
+        data = {
+            "school_id": students[0].school_id,
+            "course_titles": ["Batch One", "Batch Two", "Missing Course", "Batch One"],
+        }
+        response = self.client.post("api/v0/courses/enroll/batch", json=data, headers=headers)
+        assert response.status_code == 201
+        assert response.json["enrolled"] == 2
+        assert [result["status"] for result in response.json["results"]] == [
+            "enrolled", "enrolled", "not found", "duplicate",
+        ]
+
+        # One course, many students
+        data = {
+            "course_title": "Batch One",
+            "school_ids": [student.school_id for student in students] + ["bad-id"],
+        }
+        response = self.client.post("api/v0/courses/enroll/batch", json=data, headers=headers)
+        assert response.status_code == 201
+        assert [result["status"] for result in response.json["results"]] == [
+            "already enrolled", "enrolled", "enrolled", "invalid school ID",
+        ]
+        course = Course.get_by_title("Batch One")
+        assert all(course.has_student(student.id) for student in students)
+
+        data = {"course_title": "Batch One", "course_titles": ["Batch Two"]}
+        response = self.client.post("api/v0/courses/enroll/batch", json=data, headers=headers)
+        assert response.status_code == 400
+
+        data = {"school_id": "bad-id", "course_titles": ["Batch Two"]}
+        response = self.client.post("api/v0/courses/enroll/batch", json=data, headers=headers)
+        assert response.status_code == 400
+        assert response.json["message"] == "Invalid school ID"
+
+    def test_compiled_serializers_match_marshal(self):
+        teacher = Teacher("Serial Teacher", "serialteacher@gmail.com", "password123")
+        teacher.save()
+        student = Student("Serial Student", "serialstudent@gmail.com", "password123")
+        student.save()
+        course = Course("Serialization", "SE101", 2, teacher_id=teacher.id)
+        course.save()
+        course.students.append(student)
+        course.commit_update()
+        grade = Grade(student_id=student.id, course_id=course.id, score=71.5)
+        grade.allocate_letter_grade()
+        db.session.add(grade)
+        db.session.commit()
+
+        cases = [
+            (course, course_output_model),
+            (course, course_detail_model),
+            (Course.get_by_title("Backend Engineering"), course_output_model),
+            (student, student_model),
+            (grade, grade_model),
+            (Student.query.all(), student_model),
+        ]
+        for data, model in cases:
+            expected = json.dumps(restx_marshal(data, model), indent=4)
+            assert json.dumps(marshal(data, model), indent=4) == expected
+
+        # Column rows give the same output as ORM objects
+        rows = select_columns(Student.query.order_by(Student.id), student_model).all()
+        assert json.dumps(marshal(rows, student_model)) == json.dumps(
+            restx_marshal(Student.query.order_by(Student.id).all(), student_model)
+        )
+
+    def get_statements(self, url, headers):
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        # Start from a clean session so every request loads what it needs
+        db.session.expunge_all()
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+        try:
+            response = self.client.get(url, headers=headers)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_statement)
+        assert response.status_code == 200
+        return response, statements
+
+    def test_course_queries_are_constant(self):
+        headers = self.generate_auth_header()
+        for i in range(2):
+            teacher = Teacher(f"Eager Teacher{i}", f"eagerteacher{i}@gmail.com", "password123")
+            teacher.save()
+            Course(f"Eager {i}", f"EG{i}", 2, teacher_id=teacher.id).save()
+        response, few_queries = self.get_statements("api/v0/courses/?limit=2", headers)
+        assert len(response.json["items"]) == 2
+
+        for i in range(2, 8):
+            teacher = Teacher(f"Eager Teacher{i}", f"eagerteacher{i}@gmail.com", "password123")
+            teacher.save()
+            Course(f"Eager {i}", f"EG{i}", 2, teacher_id=teacher.id).save()
+        response, many_queries = self.get_statements("api/v0/courses/?limit=8", headers)
+        assert len(response.json["items"]) == 8
+        assert any(item["teacher"] for item in response.json["items"])
+        assert len(few_queries) == len(many_queries)
+
+        course = Course.get_by_title("Eager 0")
+        response, few_queries = self.get_statements(f"api/v0/courses/{course.id}", headers)
+        for i in range(5):
+            student = Student(f"Eager Student{i}", f"eagerstudent{i}@gmail.com", "password123")
+            student.save()
+            course.enroll(student.id)
+        db.session.commit()
+        response, many_queries = self.get_statements(f"api/v0/courses/{course.id}", headers)
+        assert response.json["student_count"] == 5
+        assert response.json["teacher"]["full_name"] == "Eager Teacher0"
+        assert len(few_queries) == len(many_queries)
+
+    def test_course_students_are_paginated(self):
+        headers = self.generate_auth_header()
+        course = Course("Roster", "RS101", 2)
+        course.save()
+        names = ["Zed Roster", "Amy Roster", "Kim Roster", "Bob Roster", "Lee Roster"]
+        for i, name in enumerate(names):
+            student = Student(name, f"roster{i}@gmail.com", "password123")
+            student.save()
+            course.enroll(student.id)
+        db.session.commit()
+
+        url = f"api/v0/courses/{course.id}/students"
+        seen = []
+        response = self.client.get(f"{url}?limit=2", headers=headers)
+        while True:
+            assert response.status_code == 200
+            seen += [item["full_name"] for item in response.json["items"]]
+            cursor = response.json["next_cursor"]
+            if cursor is None:
+                break
+            response = self.client.get(f"{url}?limit=2&cursor={cursor}", headers=headers)
+        assert seen == sorted(names)
+
+        response = self.client.get(f"{url}?sort=school_id&all=true", headers=headers)
+        school_ids = [item["school_id"] for item in response.json]
+        assert school_ids == sorted(school_ids) and len(school_ids) == 5
+
+        response = self.client.get(f"api/v0/courses/{course.id}", headers=headers)
+        assert response.json["student_count"] == 5
+        assert "students" not in response.json
+
+        response = self.client.get("api/v0/courses/9999/students", headers=headers)
+        assert response.status_code == 404
+
+    def test_course_students_with_null_names_are_paginated(self):
+        headers = self.generate_auth_header()
+        course = Course("Nameless", "NL101", 2)
+        course.save()
+        student_ids = []
+        for i in range(3):
+            student = Student(f"Nameless Student{i}", f"nameless{i}@gmail.com", "password123")
+            student.save()
+            course.enroll(student.id)
+            student_ids.append(student.id)
+        db.session.commit()
+        for student_id in student_ids[:2]:
+            Student.query.get(student_id).full_name = None
+        db.session.commit()
+
+        url = f"api/v0/courses/{course.id}/students"
+        seen = []
+        response = self.client.get(f"{url}?limit=1", headers=headers)
+        while True:
+            assert response.status_code == 200
+            seen += [item["id"] for item in response.json["items"]]
+            cursor = response.json["next_cursor"]
+            if cursor is None:
+                break
+            response = self.client.get(f"{url}?limit=1&cursor={cursor}", headers=headers)
+        assert seen == student_ids
+
+    def test_conditional_gets_of_courses(self):
+        headers = self.generate_auth_header()
+        teacher = Teacher("Etag Teacher", "etagteacher@gmail.com", "password123")
+        teacher.save()
+        course = Course("Etags", "ET101", 2, teacher_id=teacher.id)
+        course.save()
+        student = Student("Etag Student", "etagstudent@gmail.com", "password123")
+        student.save()
+        student_id = student.id
+
+        def etag_of(url):
+            response = self.client.get(url, headers=headers)
+            assert response.status_code == 200
+            assert response.headers["ETag"].startswith('W/"')
+            not_modified = self.client.get(
+                url, headers=dict(headers, **{"If-None-Match": response.headers["ETag"]})
+            )
+            assert not_modified.status_code == 304 and not_modified.data == b""
+            return response.headers["ETag"]
+
+        detail_url = f"api/v0/courses/{course.id}"
+        list_urls = ["api/v0/courses/", "api/v0/courses/?all=true", f"api/v0/courses/?teacher_id={teacher.id}"]
+        etags = [etag_of(url) for url in [detail_url] + list_urls]
+
+        # Unchanged courses answer 304 without loading or marshalling them
+        db.session.expunge_all()
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.client.get(detail_url, headers=dict(headers, **{"If-None-Match": etags[0]}))
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        assert response.status_code == 304
+        assert not any("teacher" in statement for statement in statements)
+
+        # Enrolments, teacher changes and course updates each change the ETags
+        course = db.session.get(Course, course.id)
+        course.enroll(student_id)
+        Course.commit_update()
+        assert self.client.get(detail_url, headers=headers).json["student_count"] == 1
+        new_etags = [etag_of(url) for url in [detail_url] + list_urls]
+        assert new_etags[0] != etags[0] and new_etags[1:] != etags[1:]
+
+        etags = new_etags
+        db.session.get(Teacher, teacher.id).full_name = "Renamed Teacher"
+        Teacher.commit_update()
+        new_etags = [etag_of(url) for url in [detail_url] + list_urls]
+        assert all(new != old for new, old in zip(new_etags, etags))
+
+        etags = new_etags
+        response = self.client.put(detail_url, json={"credit_unit": 3}, headers=headers)
+        assert response.status_code == 200
+        new_etags = [etag_of(url) for url in [detail_url] + list_urls]
+        assert all(new != old for new, old in zip(new_etags, etags))
+
+        # A course added to the list changes its ETag even though no other course changed
+        Course("Etags Two", "ET102", 2, teacher_id=teacher.id).save()
+        assert etag_of(list_urls[2]) != new_etags[3]
+        assert etag_of(detail_url) == new_etags[0]
+
+    def test_deleting_a_student_changes_course_etags(self):
+        headers = self.generate_auth_header()
+        course = Course("Deletes", "DE101", 2)
+        course.save()
+        student = Student("Deleted Student", "deletedstudent@gmail.com", "password123")
+        student.save()
+        course.enroll(student.id)
+        Course.commit_update()
+        course_id, student_id = course.id, student.id
+
+        url = f"api/v0/courses/{course_id}"
+        response = self.client.get(url, headers=headers)
+        assert response.json["student_count"] == 1
+        etag = response.headers["ETag"]
+
+        assert self.client.delete(f"api/v0/students/{student_id}", headers=headers).status_code == 204
+        response = self.client.get(url, headers=dict(headers, **{"If-None-Match": etag}))
+        assert response.status_code == 200
+        assert response.json["student_count"] == 0
+        assert response.headers["ETag"] != etag
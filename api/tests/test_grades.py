@@ -3,8 +3,11 @@ from unittest import TestCase
 from .. import create_app
 from ..database import db
 from ..models.courses import Course
-from ..models.students import Student
+from ..models.students import Student, shift_grade_totals
 from ..models.teachers import Teacher
+from ..models.grades import Grade
+from ..models.scales import CompiledScale, DEFAULT_GRADING_BANDS, GradingScale, get_grading_scale
+from ..models.users import Admin
 
 
 class GradeTestCase(TestCase):
@@ -87,4 +90,248 @@ class GradeTestCase(TestCase):
         )
         assert response.status_code == 200
         assert b'"score": 40.5' in response.data
-        assert b'"letter_grade": "C"' in response.data
\ No newline at end of file
+        assert b'"letter_grade": "C"' in response.data
+
+    def create_graded_student(self, full_name, email_address, scores):
+        student = Student(full_name, email_address, "password123")
+        student.save()
+        courses = []
+        for i, score in enumerate(scores):
+            course = Course(f"{student.id}-G{i}", f"{student.id}G{i}", 2)
+            course.save()
+            course.students.append(student)
+            course.commit_update()
+            grade = Grade(student_id=student.id, course_id=course.id, score=score)
+            grade.allocate_letter_grade()
+            grade.save()
+            courses.append(course)
+        return student, courses
+
+    def test_deleting_a_course_deletes_its_grades(self):
+        student, courses = self.create_graded_student(
+            "Deleted Course Student", "deletedcourse@gmail.com", [80.0]
+        )
+        course_id = courses[0].id
+        courses[0].delete()
+        assert Grade.query.filter_by(course_id=course_id).count() == 0
+        db.session.expire_all()
+        assert (student.total_points, student.total_credit_units) == (0.0, 0)
+        assert student.gpa is None
+
+        # SQLite hands the freed ID to the next course, which must start ungraded
+        new_course = Course("Reused Id", "RI101", 2)
+        new_course.save()
+        assert new_course.id == course_id
+        new_course.students.append(student)
+        new_course.commit_update()
+        assert student.get_transcript() == ([{"course_title": "Reused Id", "grade": None}], None)
+        assert student.id not in [item["student_id"] for item in Student.reconcile_grade_totals(fix=False)]
+
+    def test_grade_totals_follow_grade_and_course_changes(self):
+        student, courses = self.create_graded_student(
+            "Totals Student", "totals@gmail.com", [80.0, 40.0]
+        )
+        assert (student.total_points, student.total_credit_units) == (12.0, 4)
+        assert float(student.gpa) == 3.0
+
+        # A -> D in the first course
+        grade = Grade.query.get((student.id, courses[0].id))
+        grade.score = 10.0
+        grade.allocate_letter_grade()
+        grade.commit_update()
+        assert (student.total_points, student.total_credit_units) == (6.0, 4)
+
+        # Raising the credit unit of the second course (graded C)
+        courses[1].credit_unit = 4
+        courses[1].commit_update()
+        assert (student.total_points, student.total_credit_units) == (10.0, 6)
+        assert float(student.gpa) == 1.67
+
+        grade.delete()
+        assert (student.total_points, student.total_credit_units) == (8.0, 4)
+        assert float(student.gpa) == 2.0
+
+    def test_unregistering_keeps_the_grade(self):
+        student, courses = self.create_graded_student(
+            "Unregistered Student", "unregistered@gmail.com", [80.0, 40.0]
+        )
+        headers = self.generate_auth_header()
+        data = {"course_title": courses[0].title, "school_id": student.school_id}
+        response = self.client.delete("api/v0/courses/enroll", json=data, headers=headers)
+        assert response.status_code == 204
+
+        # The grade is kept but only enrolled courses count towards the GPA
+        assert Grade.query.get((student.id, courses[0].id)) is not None
+        db.session.expire_all()
+        assert (student.total_points, student.total_credit_units) == (4.0, 2)
+        assert float(student.gpa) == 2.0
+
+        # Registering again brings the grade back
+        courses[0].students.append(student)
+        courses[0].commit_update()
+        assert (student.total_points, student.total_credit_units) == (12.0, 4)
+        assert float(student.gpa) == 3.0
+        assert Student.reconcile_grade_totals(fix=False) == []
+
+    def test_reconcile_gpa_command_reports_drift(self):
+        student, _ = self.create_graded_student("Drift Student", "drift@gmail.com", [75.0])
+        student.total_points = 0.0
+        student.gpa = None
+        student.commit_update()
+
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=["reconcile-gpa", "--dry-run"])
+        assert f"Student {student.id}:" in result.output
+        assert student.total_points == 0.0
+
+        result = runner.invoke(args=["reconcile-gpa"])
+        assert "Fixed 1 student(s)" in result.output
+        db.session.expire_all()
+        assert (student.total_points, student.total_credit_units) == (8.0, 2)
+        assert float(student.gpa) == 4.0
+
+    def test_bulk_grade_course(self):
+        headers = self.generate_auth_header()
+        course = Course("Bulk Grading", "BG101", 2, teacher_id=1)
+        course.save()
+        students = []
+        for i in range(3):
+            student = Student(f"Sheet Student{i}", f"sheetstudent{i}@gmail.com", "password123")
+            student.save()
+            students.append(student)
+        Course.enroll_many([(course.id, student.id) for student in students[:2]])
+        course.commit_update()
+
+        data = [
+            {"student_id": students[0].id, "score": 75},
+            {"school_id": students[1].school_id, "score": 45},
+            {"student_id": students[2].id, "score": 60},
+            {"student_id": students[0].id, "score": 20},
+            {"student_id": students[1].id, "score": 101},
+        ]
+        response = self.client.post(f"api/v0/grade/{course.id}/bulk", json=data, headers=headers)
+        assert response.status_code == 201
+        assert [(grade["row"], grade["letter_grade"]) for grade in response.json["graded"]] == [
+            (1, "A"), (2, "C"),
+        ]
+        assert [error["row"] for error in response.json["errors"]] == [3, 4, 5]
+        assert (students[0].total_points, students[0].total_credit_units) == (8.0, 2)
+        assert float(students[1].gpa) == 2.0
+
+        # Totals are recomputed from the grades rather than shifted, so a course
+        # counted twice by an overlapping upload is put right by the next one
+        shift_grade_totals(db.session.connection(), Student.id == students[1].id, 2.0 * 2, 2)
+        db.session.commit()
+
+        # Re-uploading updates the existing grades
+        csv_data = f"student_id,score\n{students[0].id},55\n{students[1].id},45\n"
+        response = self.client.post(
+            f"api/v0/grade/{course.id}/bulk",
+            data=csv_data,
+            headers=dict(headers, **{"Content-Type": "text/csv"}),
+        )
+        assert response.status_code == 201
+        assert Grade.query.get((students[0].id, course.id)).letter_grade == "B"
+        assert (students[0].total_points, students[0].total_credit_units) == (6.0, 2)
+        assert (students[1].total_points, students[1].total_credit_units) == (4.0, 2)
+        assert Student.reconcile_grade_totals(fix=False) == []
+
+        data = [
+            {"student_id": True, "score": 90},
+            {"student_id": float(students[0].id) + 0.7, "score": 90},
+            {"student_id": str(students[0].id), "score": 90},
+        ]
+        response = self.client.post(f"api/v0/grade/{course.id}/bulk", json=data, headers=headers)
+        assert response.status_code == 201
+        assert [grade["row"] for grade in response.json["graded"]] == [3]
+        assert response.json["errors"] == [
+            {"row": 1, "message": "student_id must be a whole number"},
+            {"row": 2, "message": "student_id must be a whole number"},
+        ]
+
+    def test_compiled_scale_lookup(self):
+        scale = CompiledScale(DEFAULT_GRADING_BANDS)
+        assert scale.boundaries == [0, 30, 50, 70]
+        assert [scale.letter_for(score) for score in (0, 29.4, 29.5, 49.9, 69.4, 100)] == [
+            "D", "D", "C", "B", "B", "A",
+        ]
+        assert scale.letter_for(100.6) is None
+        scores = [i / 4 for i in range(401)]
+        assert scale.letters_for(scores) == [scale.letter_for(score) for score in scores]
+
+    def test_grading_scale_cache_is_cleared_on_commit(self):
+        course = Course("Cache Scaled", "CS101", 2)
+        course.save()
+        scale = GradingScale(course_id=course.id, bands=[{"letter": "A", "min_score": 0}])
+        scale.save()
+        assert get_grading_scale(course.id).letter_for(10) == "A"
+
+        # Until the commit, other requests must keep seeing the committed bands
+        scale.bands = [{"letter": "B", "min_score": 0}]
+        db.session.flush()
+        assert get_grading_scale(course.id).letter_for(10) == "A"
+        db.session.commit()
+        assert get_grading_scale(course.id).letter_for(10) == "B"
+
+        scale.bands = [{"letter": "C", "min_score": 0}]
+        db.session.flush()
+        db.session.rollback()
+        assert get_grading_scale(course.id).letter_for(10) == "B"
+
+        scale.delete()
+        course.delete()
+
+    def test_grading_scales(self):
+        Admin("Scale Admin", "scaleadmin@gmail.com", "password123").save()
+        response = self.client.post(
+            "api/v0/auth/login",
+            json={"email_address": "scaleadmin@gmail.com", "password": "password123"},
+        )
+        headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+        course = Course("Scaled", "SC101", 2)
+        course.save()
+
+        # The built-in scale is used until one is stored, and is then cached
+        assert get_grading_scale(course.id).letter_for(45) == "C"
+        assert get_grading_scale(course.id) is get_grading_scale(course.id)
+
+        bands = [
+            {"letter": "A", "min_score": 80},
+            {"letter": "B", "min_score": 60},
+            {"letter": "C", "min_score": 45},
+            {"letter": "F", "min_score": 0},
+        ]
+        response = self.client.post("api/v0/grade/scales", json={"bands": bands}, headers=headers)
+        assert response.status_code == 201
+        default_id = response.json["id"]
+        assert get_grading_scale(course.id).letter_for(40) == "F"
+
+        override = {"course_id": course.id, "bands": [{"letter": "A", "min_score": 0}]}
+        response = self.client.post("api/v0/grade/scales", json=override, headers=headers)
+        assert response.status_code == 201
+        override_id = response.json["id"]
+        assert get_grading_scale(course.id).letter_for(10) == "A"
+        assert get_grading_scale(course.id + 1).letter_for(10) == "F"
+
+        grade = Grade(student_id=1, course_id=course.id, score=12.0)
+        grade.allocate_letter_grade()
+        assert grade.letter_grade == "A"
+
+        # Editing a scale drops the compiled copy
+        data = {"bands": [{"letter": "B", "min_score": 0}]}
+        response = self.client.put(f"api/v0/grade/scales/{override_id}", json=data, headers=headers)
+        assert response.status_code == 200
+        assert get_grading_scale(course.id).letter_for(10) == "B"
+
+        bad_bands = {"bands": [{"letter": "Z", "min_score": 0}]}
+        response = self.client.post("api/v0/grade/scales", json=bad_bands, headers=headers)
+        assert response.status_code == 400
+        bad_bands = {"bands": [{"letter": "A", "min_score": 10}]}
+        response = self.client.put(f"api/v0/grade/scales/{override_id}", json=bad_bands, headers=headers)
+        assert response.status_code == 400
+
+        for scale_id in (override_id, default_id):
+            response = self.client.delete(f"api/v0/grade/scales/{scale_id}", headers=headers)
+            assert response.status_code == 204
+        assert GradingScale.query.count() == 0
+        assert get_grading_scale(course.id).letter_for(40) == "C"
@@ -0,0 +1,135 @@
+import atexit
+import gc
+import os
+import re
+import tempfile
+import threading
+from unittest import TestCase
+
+from flask import Flask
+
+from .. import create_app
+from ..database import db
+from ..metrics import MetricsRegistry
+from ..models.users import Admin
+
+
+def sample(text, name, **labels):
+    """
+    The value of one sample in Prometheus text, or None if it is missing
+    """
+    for line in text.splitlines():
+        match = re.match(rf"{name}{{(.*)}} (\S+)$", line)
+        if match and all(f'{key}="{value}"' in match.group(1) for key, value in labels.items()):
+            return float(match.group(2))
+    return None
+
+
+class MetricsTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app("config.Test")
+        cls.test_app = cls.app.app_context()
+        cls.test_app.push()
+        cls.client = cls.app.test_client()
+
+        db.create_all()
+        Admin("Metrics Admin", "metricsadmin@gmail.com", "password123").save()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.drop_all()
+        cls.test_app.pop()
+        cls.app = None
+        cls.client = None
+
+    def test_metrics_per_endpoint_and_status(self):
+        data = {"email_address": "metricsadmin@gmail.com", "password": "password123"}
+        token = self.client.post("api/v0/auth/login", json=data).json["access_token"]
+        header = {"Authorization": f"Bearer {token}"}
+        for _ in range(3):
+            assert self.client.get("api/v0/students/", headers=header).status_code == 200
+        assert self.client.get("api/v0/students/999", headers=header).status_code == 404
+
+        response = self.client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"})
+        assert response.status_code == 200
+        assert response.content_type.startswith("text/plain; version=0.0.4")
+        text = response.get_data(as_text=True)
+
+        students = {"endpoint": "/api/v0/students/", "method": "GET", "status": "200"}
+        assert sample(text, "http_requests_total", **students) == 3
+        assert sample(text, "http_request_duration_seconds_count", **students) == 3
+        assert sample(text, "http_request_duration_seconds_bucket", le="+Inf", **students) == 3
+        assert sample(text, "db_queries_total", **students) >= 3
+        assert sample(text, "db_query_duration_seconds_total", **students) > 0
+        assert sample(
+            text, "http_requests_total",
+            endpoint="/api/v0/students/<int:student_id>", method="GET", status="404",
+        ) == 1
+        assert sample(
+            text, "http_requests_total", endpoint="/api/v0/auth/login", method="POST", status="200"
+        ) == 1
+
+    def test_metrics_need_the_token(self):
+        assert self.client.get("/metrics").status_code == 401
+        wrong = {"Authorization": "Bearer wrong-token"}
+        assert self.client.get("/metrics", headers=wrong).status_code == 401
+
+        self.app.extensions["metrics"].token = None
+        try:
+            header = {"Authorization": "Bearer test-metrics-token"}
+            assert self.client.get("/metrics", headers=header).status_code == 404
+        finally:
+            self.app.extensions["metrics"].token = "test-metrics-token"
+
+    def test_recording_from_many_threads(self):
+        registry = MetricsRegistry(Flask(__name__), buckets=(0.1, 1.0))
+
+        def record():
+            for _ in range(1000):
+                registry.record("/threads", "GET", 200, 0.5, queries=2, db_time=0.01)
+
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        values = registry.snapshot()[("/threads", "GET", 200)]
+        assert values[:3] == [8000, 4000.0, 16000]
+        assert values[4:] == [0, 8000, 0]
+
+    def test_shards_of_ended_threads_are_retired(self):
+        registry = MetricsRegistry(Flask(__name__))
+
+        for _ in range(20):
+            thread = threading.Thread(target=registry.record, args=("/short", "GET", 200, 0.1))
+            thread.start()
+            thread.join()
+        del thread
+        gc.collect()
+
+        assert registry._shards == []
+        assert registry.snapshot()[("/short", "GET", 200)][0] == 20
+
+    def test_workers_are_added_up_through_the_metrics_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            other_worker = MetricsRegistry(Flask(__name__), directory=directory)
+            other_worker.record("/shared", "GET", 200, 0.2, queries=1)
+            other_worker.flush()
+            os.replace(other_worker._path, os.path.join(directory, "metrics-other.json"))
+
+            worker = MetricsRegistry(Flask(__name__), directory=directory)
+            worker.record("/shared", "GET", 200, 0.3, queries=2)
+            worker.record("/shared", "GET", 500, 0.01)
+
+            text = worker.render()
+            atexit.unregister(other_worker.flush)
+            atexit.unregister(worker.flush)
+            assert sample(text, "http_requests_total", endpoint="/shared", status="200") == 2
+            assert sample(text, "http_requests_total", endpoint="/shared", status="500") == 1
+            assert sample(text, "db_queries_total", endpoint="/shared", status="200") == 3
+            assert sample(
+                text, "http_request_duration_seconds_bucket", endpoint="/shared", status="200", le="0.25"
+            ) == 1
@@ -0,0 +1,209 @@
+import re
+from unittest import TestCase
+
+from flask import g
+from sqlalchemy import event
+
+from .. import create_app
+from ..database import db
+from ..instrumentation import statement_shape
+from ..models.courses import Course
+from ..models.grades import Grade
+from ..models.students import Student
+from ..models.teachers import Teacher
+from ..models.users import Admin
+
+
+SCAN = re.compile(r"^SCAN (\w+)")
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on every statement the hot endpoints issue and
+    fails on full table scans. Scans are only allowed for keyset pages that
+    walk an index in order and stop at the LIMIT.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app("config.Test")
+        cls.test_app = cls.app.app_context()
+        cls.test_app.push()
+        cls.client = cls.app.test_client()
+
+        db.create_all()
+
+        Admin("Plan Admin", "planadmin@gmail.com", "password123").save()
+        teacher = Teacher("Plan Teacher", "planteacher@gmail.com", "password123")
+        teacher.save()
+        cls.teacher_id = teacher.id
+        course = Course("Plans", "PL101", 2, teacher_id=teacher.id)
+        course.save()
+        cls.course_id = course.id
+
+        cls.students = []
+        for i in range(3):
+            student = Student(f"Plan Student{i}", f"planstudent{i}@gmail.com", "password123")
+            student.save()
+            course.enroll(student.id)
+            cls.students.append((student.id, student.school_id))
+        db.session.commit()
+
+        grade = Grade(student_id=cls.students[0][0], course_id=course.id, score=80)
+        grade.allocate_letter_grade()
+        db.session.add(grade)
+        db.session.commit()
+        cls.tables = set(db.metadata.tables)
+
+    @classmethod
+    def tearDownClass(cls):
+        db.drop_all()
+        cls.test_app.pop()
+        cls.app = None
+        cls.client = None
+
+    def login(self, **credentials):
+        response = self.client.post("api/v0/auth/login", json=dict(credentials, password="password123"))
+        return {"Authorization": f"Bearer {response.json['access_token']}"}
+
+    def admin_header(self):
+        return self.login(email_address="planadmin@gmail.com")
+
+    def teacher_header(self):
+        return self.login(email_address="planteacher@gmail.com")
+
+    def assert_no_full_scans(self, method, url, **kwargs):
+        statements = []
+
+        def capture_statement(conn, cursor, statement, parameters, context, executemany):
+            if not executemany:
+                statements.append((statement, parameters))
+
+        db.session.expunge_all()
+        event.listen(db.engine, "before_cursor_execute", capture_statement)
+        try:
+            response = getattr(self.client, method)(url, **kwargs)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", capture_statement)
+        assert response.status_code < 500
+
+        with db.engine.connect() as connection:
+            for statement, parameters in statements:
+                if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                    continue
+                plan = [
+                    row[3] for row in
+                    connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                ]
+                scanned = [
+                    match.group(1) for match in map(SCAN.match, plan)
+                    if match and match.group(1) in self.tables
+                ]
+                ordered_page = " LIMIT " in statement and not any("TEMP B-TREE" in step for step in plan)
+                assert not scanned or ordered_page, (
+                    f"{method.upper()} {url} scans {scanned}:\n{statement}\n{plan}"
+                )
+        return response
+
+    def test_login_plans(self):
+        self.assert_no_full_scans(
+            "post", "api/v0/auth/login",
+            json={"email_address": "planadmin@gmail.com", "password": "password123"},
+        )
+        self.assert_no_full_scans(
+            "post", "api/v0/auth/login",
+            json={"school_id": self.students[1][1], "password": "password123"},
+        )
+
+    def test_student_plans(self):
+        headers = self.admin_header()
+        student_id = self.students[0][0]
+        for url in [
+            "api/v0/students/",
+            f"api/v0/students/?course_id={self.course_id}&min_gpa=1",
+            "api/v0/students/?school_id=ALT/PLAN",
+            f"api/v0/students/{student_id}",
+            f"api/v0/students/{student_id}/result",
+            f"api/v0/students/{student_id}/courses",
+        ]:
+            self.assert_no_full_scans("get", url, headers=headers)
+
+    def test_course_plans(self):
+        headers = self.admin_header()
+        for url in [
+            "api/v0/courses/",
+            f"api/v0/courses/?teacher_id={self.teacher_id}",
+            f"api/v0/courses/{self.course_id}",
+            f"api/v0/courses/{self.course_id}/students",
+            f"api/v0/courses/{self.course_id}/students?sort=school_id",
+        ]:
+            self.assert_no_full_scans("get", url, headers=headers)
+
+        # Changing the credit unit shifts the grade totals of every graded student
+        self.assert_no_full_scans(
+            "put", f"api/v0/courses/{self.course_id}", json={"credit_unit": 3}, headers=headers
+        )
+
+        student_id, school_id = self.students[2]
+        data = {"course_title": "Plans", "school_id": school_id}
+        student_headers = self.login(school_id=school_id)
+        self.assert_no_full_scans("delete", "api/v0/courses/enroll", json=data, headers=student_headers)
+        self.assert_no_full_scans("post", "api/v0/courses/enroll", json=data, headers=student_headers)
+
+    def test_grade_plans(self):
+        headers = self.teacher_header()
+        (first_id, _), (second_id, _), (third_id, _) = self.students
+        self.assert_no_full_scans("get", f"api/v0/grade/{first_id}/{self.course_id}", headers=headers)
+        self.assert_no_full_scans(
+            "put", f"api/v0/grade/{first_id}/{self.course_id}", json={"score": 55}, headers=headers
+        )
+        self.assert_no_full_scans(
+            "post", f"api/v0/grade/{second_id}/{self.course_id}", json={"score": 65}, headers=headers
+        )
+        self.assert_no_full_scans(
+            "post", f"api/v0/grade/{self.course_id}/bulk",
+            json=[{"student_id": third_id, "score": 90}], headers=headers,
+        )
+
+    def test_teacher_plans(self):
+        headers = self.admin_header()
+        self.assert_no_full_scans("get", "api/v0/teachers/", headers=headers)
+        self.assert_no_full_scans("get", f"api/v0/teachers/{self.teacher_id}", headers=headers)
+
+    def test_sqlite_pragmas_are_applied(self):
+        with db.engine.connect() as connection:
+            pragma = lambda name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            assert pragma("journal_mode") == "wal"
+            assert pragma("synchronous") == 1
+            assert pragma("busy_timeout") == 5000
+
+    def test_requests_log_a_query_summary_and_repeated_statements(self):
+        header = self.admin_header()
+        instrumentation = self.app.extensions["query_instrumentation"]
+
+        with self.assertLogs(self.app.logger, "INFO") as logs:
+            response = self.client.get(f"api/v0/courses/{self.course_id}", headers=header)
+        assert response.status_code == 200
+        summary = [line for line in logs.output if f"GET /api/v0/courses/{self.course_id} 200" in line]
+        assert len(summary) == 1 and " queries in " in summary[0]
+        assert not any("N+1" in line for line in logs.output)
+
+        # The same query for each student is flagged, whatever its IN values
+        with self.app.test_request_context("/n-plus-one"):
+            instrumentation.start_request()
+            for i, (student_id, _) in enumerate(self.students):
+                db.session.execute(
+                    db.select(Student.full_name).where(Student.id.in_([student_id] * (i + 2)))
+                ).all()
+            assert g.queries.count == len(self.students)
+            assert g.queries.repeated(2) == [(statement_shape(
+                "SELECT student.full_name FROM student WHERE student.id IN (?, ?)"
+            ), 3)]
+
+            instrumentation.n_plus_one_threshold = 2
+            try:
+                with self.assertLogs(self.app.logger, "WARNING") as logs:
+                    instrumentation.finish_request(self.app.response_class())
+            finally:
+                instrumentation.n_plus_one_threshold = 10
+        assert "Possible N+1 query in GET /n-plus-one, run 3 times" in logs.output[0]
@@ -1,8 +1,17 @@
+import json
+from datetime import date
 from unittest import TestCase
 
+from sqlalchemy import event
+
 from .. import create_app
 from ..database import db
+from ..models.courses import Course
+from ..models.grades import Grade
+from ..models.sequences import SchoolIdAllocator, SchoolIdSequence
+from ..models.students import Student, shift_grade_totals
 from ..models.users import Admin
+from ..util import EMAIL_REGEX, diagnose_email, encode_cursor, is_valid_email, is_valid_school_id, validate_emails
 
 
 class StudentTestCase(TestCase):
@@ -53,8 +62,65 @@ class StudentTestCase(TestCase):
         headers = self.generate_auth_header()
         response = self.client.get("api/v0/students/", headers=headers)
         assert response.status_code == 200
+        assert isinstance(response.json["items"], list)
+        assert "next_cursor" in response.json
+
+        # The unpaginated list is still available on request
+        response = self.client.get("api/v0/students/?all=true", headers=headers)
+        assert response.status_code == 200
         assert isinstance(response.json, list)
 
+    def test_paginate_and_filter_students(self):
+        headers = self.generate_auth_header()
+        for i in range(5):
+            Student(f"Page Student{i}", f"pagestudent{i}@gmail.com", "password123").save()
+
+        seen = []
+        cursor = None
+        while True:
+            query = "limit=2" + (f"&cursor={cursor}" if cursor else "")
+            response = self.client.get(f"api/v0/students/?{query}", headers=headers)
+            assert response.status_code == 200
+            assert len(response.json["items"]) <= 2
+            seen += [student["id"] for student in response.json["items"]]
+            cursor = response.json["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == sorted(seen)
+        assert len(seen) == len(set(seen)) == Student.query.count()
+
+        response = self.client.get("api/v0/students/?school_id=ALT/PAGE", headers=headers)
+        assert len(response.json["items"]) == 5
+
+        # A prefix ending in the last code point has no next character to bound it
+        student = Student.query.filter_by(email_address="pagestudent0@gmail.com").first()
+        student.school_id = "ALT/PAGE\U0010FFFF0"
+        student.commit_update()
+        for prefix, count in (("ALT/PAGE\U0010FFFF", 1), ("\U0010FFFF", 0)):
+            response = self.client.get(
+                "api/v0/students/", query_string={"school_id": prefix}, headers=headers
+            )
+            assert response.status_code == 200
+            assert len(response.json["items"]) == count
+
+        response = self.client.get("api/v0/students/?cursor=not-a-cursor", headers=headers)
+        assert response.status_code == 400
+
+        # Cursors must hold a value of each sort key's type
+        for values in ([{}], ["1"], [True], [1, 2]):
+            response = self.client.get(f"api/v0/students/?cursor={encode_cursor(values)}", headers=headers)
+            assert response.status_code == 400
+        course = Course("Cursor Course", "CC101", 2)
+        course.save()
+        url = f"api/v0/courses/{course.id}/students?cursor="
+        response = self.client.get(url + encode_cursor(["Page Student1", 1]), headers=headers)
+        assert response.status_code == 200
+        response = self.client.get(url + encode_cursor([1, 1]), headers=headers)
+        assert response.status_code == 400
+
+        response = self.client.get("api/v0/students/?limit=0", headers=headers)
+        assert response.status_code == 400
+
     def tests_on_single_student(self):
         headers = self.generate_auth_header()
 
@@ -74,3 +140,336 @@ class StudentTestCase(TestCase):
         # Delete student:
         response = self.client.delete("api/v0/students/1", headers=headers)
         assert response.status_code == 204
+
+    def create_graded_student(self, full_name, email_address, num_courses):
+        student = Student(full_name, email_address, "password123")
+        student.save()
+        for i in range(num_courses):
+            course = Course(f"{student.id}-C{i}", f"{student.id}C{i}", 2)
+            course.save()
+            course.students.append(student)
+            course.commit_update()
+            grade = Grade(student_id=student.id, course_id=course.id, score=40.0 + 10 * i)
+            grade.allocate_letter_grade()
+            grade.save()
+        return student
+
+    def get_result_statements(self, student_id, headers):
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        # Start from a clean session so every request loads what it needs
+        db.session.expire_all()
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+        try:
+            response = self.client.get(f"api/v0/students/{student_id}/result", headers=headers)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_statement)
+        assert response.status_code == 200
+        return response, statements
+
+    def test_result_query_count_is_constant(self):
+        headers = self.generate_auth_header()
+        one_course = self.create_graded_student("Result One", "resultone@gmail.com", 1)
+        five_courses = self.create_graded_student("Result Five", "resultfive@gmail.com", 5)
+
+        response, few_queries = self.get_result_statements(one_course.id, headers)
+        assert response.json["result"]["GPA"] == 2.0
+        assert len(response.json["result"]["course_results"]) == 1
+
+        response, many_queries = self.get_result_statements(five_courses.id, headers)
+        assert len(response.json["result"]["course_results"]) == 5
+        assert response.json["result"]["GPA"] == 3.2
+        assert len(few_queries) == len(many_queries)
+
+    def test_result_is_read_only(self):
+        headers = self.generate_auth_header()
+        student = self.create_graded_student("Result Reader", "resultreader@gmail.com", 3)
+        # A stale stored GPA must not be rewritten by a read
+        student.gpa = 1.5
+        student.commit_update()
+
+        response, statements = self.get_result_statements(student.id, headers)
+        assert response.json["result"]["GPA"] == 2.67
+        assert not any(
+            statement.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE"))
+            for statement in statements
+        )
+        db.session.expire_all()
+        assert float(student.gpa) == 1.5
+
+    def test_filter_students_by_gpa_and_course(self):
+        headers = self.generate_auth_header()
+        student = self.create_graded_student("Filter Student", "filterstudent@gmail.com", 2)
+        course = Course.query.filter_by(title=f"{student.id}-C0").first()
+
+        response = self.client.get(f"api/v0/students/?course_id={course.id}", headers=headers)
+        assert [item["id"] for item in response.json["items"]] == [student.id]
+
+        response = self.client.get("api/v0/students/?min_gpa=2.5&max_gpa=2.5", headers=headers)
+        assert student.id in [item["id"] for item in response.json["items"]]
+
+        response = self.client.get("api/v0/students/?min_gpa=3", headers=headers)
+        assert student.id not in [item["id"] for item in response.json["items"]]
+
+    def test_export_students(self):
+        headers = self.generate_auth_header()
+        Student("Export Student", "exportstudent@gmail.com", "password123").save()
+        total = Student.query.count()
+
+        response = self.client.get("api/v0/students/export", headers=headers)
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.data.decode().splitlines()]
+        assert len(rows) == total
+        assert "exportstudent@gmail.com" in [row["email_address"] for row in rows]
+
+        response = self.client.get("api/v0/students/export?format=csv", headers=headers)
+        assert response.status_code == 200
+        assert response.mimetype == "text/csv"
+        lines = response.data.decode().splitlines()
+        assert lines[0] == "id,full_name,email_address,role,school_id,gpa"
+        assert len(lines) == total + 1
+
+    def test_bulk_create_students(self):
+        headers = self.generate_auth_header()
+        Student("Existing Student", "existing@gmail.com", "password123").save()
+        data = [
+            {"full_name": "Bulk One", "email_address": "bulkone@gmail.com"},
+            {"full_name": "Bulk Two", "email_address": "bulktwo@gmail.com"},
+            {"full_name": "Bulk", "email_address": "bulkthree@gmail.com"},
+            {"full_name": "Bulk Four", "email_address": "bulkone@gmail.com"},
+            {"full_name": "Bulk Five", "email_address": "existing@gmail.com"},
+            {"full_name": "Bulk Six", "email_address": "not-an-email"},
+        ]
+        response = self.client.post("api/v0/students/bulk", json=data, headers=headers)
+        assert response.status_code == 201
+        assert [row["row"] for row in response.json["created"]] == [1, 2]
+        assert [error["row"] for error in response.json["errors"]] == [3, 4, 5, 6]
+
+        student = Student.find_by_email("bulktwo@gmail.com")
+        assert student.school_id == response.json["created"][1]["school_id"]
+        assert (student.total_points, student.total_credit_units) == (0.0, 0)
+
+        csv_data = "full_name,email_address\nCsv Student,csvstudent@gmail.com\n"
+        response = self.client.post(
+            "api/v0/students/bulk",
+            data=csv_data,
+            headers=dict(headers, **{"Content-Type": "text/csv"}),
+        )
+        assert response.status_code == 201
+        assert Student.find_by_email("csvstudent@gmail.com") is not None
+
+        # Bulk imported students can log in with their school ID straight away
+        login = {"school_id": student.school_id, "password": "password123"}
+        response = self.client.post("api/v0/auth/login", json=login)
+        assert response.status_code == 200
+
+        response = self.client.post("api/v0/students/bulk", json=data[4:], headers=headers)
+        assert response.status_code == 400
+        assert len(response.json["errors"]) == 2
+
+        # Rows of the wrong shape are reported instead of failing the request
+        malformed = [
+            {"full_name": 5, "email_address": "typed@gmail.com"},
+            "not an object",
+            {"full_name": "Typed Student", "email_address": ["typed@gmail.com"]},
+        ]
+        response = self.client.post("api/v0/students/bulk", json=malformed, headers=headers)
+        assert response.status_code == 400
+        assert [error["row"] for error in response.json["errors"]] == [1, 2, 3]
+
+    def test_school_ids_are_unique_and_valid(self):
+        first = Student("Same Name", "samename1@gmail.com", "password123")
+        first.save()
+        second = Student("Same Name", "samename2@gmail.com", "password123")
+        second.save()
+        accented = Student("Zoë O'Neil", "zoe@gmail.com", "password123")
+        accented.save()
+
+        assert first.school_id != second.school_id
+        for student in (first, second, accented):
+            assert is_valid_school_id(student.school_id)
+        assert accented.school_id.startswith("ALT/ZOE")
+
+        assert not is_valid_school_id("ALT/SAME000001/2022")
+        assert not is_valid_school_id(f"ALT/SAME000001/{date.today().year + 1}")
+
+    def test_school_id_numbers_are_reserved_in_blocks(self):
+        allocator = SchoolIdAllocator(block_size=10)
+        year = 2099
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+        try:
+            numbers = allocator.allocate(year, 3)
+            numbers += allocator.allocate(year, 7)
+            reserved = len(statements)
+            numbers += allocator.allocate(year, 25)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_statement)
+
+        assert numbers == list(range(1, 36))
+        assert reserved == 2  # update and insert of the first block only
+        assert db.session.get(SchoolIdSequence, year).next_value == 36
+
+    def count_statements(self, method, url, **kwargs):
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            # Leave out the token blocklist's periodic sync, which depends on timing
+            if "revoked_token" not in statement:
+                statements.append(statement)
+
+        # Start every request from an empty session, like a new request would
+        db.session.expunge_all()
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+        try:
+            response = getattr(self.client, method)(url, **kwargs)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_statement)
+        return response, len(statements)
+
+    def test_cached_identity_lookups(self):
+        student = Student("Cached Student", "cachedstudent@gmail.com", "password123")
+        student.save()
+        student_id, school_id = student.id, student.school_id
+        response = self.client.post(
+            "api/v0/auth/login", json={"school_id": school_id, "password": "password123"}
+        )
+        headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+        url = f"api/v0/students/{student_id}"
+
+        # Without the process cache the token's user is the only query
+        response, queries = self.count_statements("get", url, headers=headers)
+        assert response.status_code == 200
+        assert queries == 1
+
+        user_cache = self.app.extensions["user_cache"]
+        user_cache.ttl = 30
+        try:
+            self.count_statements("get", url, headers=headers)
+            response, queries = self.count_statements("get", url, headers=headers)
+            assert response.status_code == 200
+            assert response.json["email_address"] == "cachedstudent@gmail.com"
+            assert queries == 1
+
+            # Only identity columns are cached, so the token's user costs no query
+            response, queries = self.count_statements("get", "api/v0/courses/", headers=headers)
+            assert response.status_code == 200
+            assert queries == 2
+
+            # Columns written by bulk updates are read fresh, not from the cache
+            shift_grade_totals(db.session.connection(), Student.id == student_id, 4.0, 1)
+            db.session.commit()
+            response = self.client.get(url, headers=headers)
+            assert response.json["gpa"] == 4.0
+
+            # Updating the user drops the cached copy
+            student = db.session.get(Student, student_id)
+            student.email_address = "cachedstudent2@gmail.com"
+            student.commit_update()
+            response, queries = self.count_statements("get", url, headers=headers)
+            assert response.json["email_address"] == "cachedstudent2@gmail.com"
+            assert queries == 1
+        finally:
+            user_cache.ttl = 0
+            user_cache.clear()
+
+    def test_email_validation_fast_path(self):
+        common = ["john.doe@gmail.com", "x_y+z@mail.example.org", "o'neil@example.ie"]
+        for email in common:
+            assert EMAIL_REGEX.match(email)
+            assert is_valid_email(email) is True
+            assert diagnose_email(email) is True
+
+        # Unusual addresses fall back to the full diagnosis
+        for email in ["a..b@example.com", "user@localhost", "not-an-email", "a@b.com\n"]:
+            assert not EMAIL_REGEX.match(email)
+            assert is_valid_email(email) == diagnose_email(email)
+        assert is_valid_email("not-an-email") != True
+
+        checks = validate_emails(["john.doe@gmail.com", "not-an-email", "john.doe@gmail.com"])
+        assert checks["john.doe@gmail.com"] is True
+        assert checks["not-an-email"] != True
+
+    def test_update_student_without_email(self):
+        headers = self.generate_auth_header()
+        student = Student("Nameless Student", "nameless@gmail.com", "password123")
+        student.save()
+        data = {"full_name": "Named Student"}
+        response = self.client.put(f"api/v0/students/{student.id}", json=data, headers=headers)
+        assert response.status_code == 200
+        assert response.json["full_name"] == "Named Student"
+        assert response.json["email_address"] == "nameless@gmail.com"
+
+        for email_address in (None, 42):
+            data = {"email_address": email_address}
+            response = self.client.put(f"api/v0/students/{student.id}", json=data, headers=headers)
+            assert response.status_code == 400
+            assert response.json["message"] == "Invalid Email address: Email address must be a string"
+
+    def test_conditional_get_of_result(self):
+        headers = self.generate_auth_header()
+        student = self.create_graded_student("Etag Result", "etagresult@gmail.com", 2)
+        other = self.create_graded_student("Etag Other", "etagother@gmail.com", 1)
+        student_id, url = student.id, f"api/v0/students/{student.id}/result"
+
+        def result_etag():
+            response = self.client.get(url, headers=headers)
+            assert response.status_code == 200
+            return response.headers["ETag"]
+
+        etag = result_etag()
+        conditional = dict(headers, **{"If-None-Match": etag})
+        db.session.expire_all()
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.client.get(url, headers=conditional)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        assert response.status_code == 304 and response.data == b""
+        assert not any("grades" in statement for statement in statements)
+
+        # Another student's grades leave the ETag alone
+        grade = Grade.query.filter_by(student_id=other.id).first()
+        grade.score = 95.0
+        grade.allocate_letter_grade()
+        grade.commit_update()
+        assert self.client.get(url, headers=conditional).status_code == 304
+
+        # Grades, course renames and enrolments all change the result
+        grade = Grade.query.filter_by(student_id=student_id).first()
+        grade.score = 95.0
+        grade.allocate_letter_grade()
+        grade.commit_update()
+        assert self.client.get(url, headers=conditional).status_code == 200
+        etag = result_etag()
+
+        course = db.session.get(Course, grade.course_id)
+        course.title = f"{student_id}-RN"
+        course.commit_update()
+        assert result_etag() != etag
+        etag = result_etag()
+
+        new_course = Course(f"{student_id}-NEW", f"{student_id}NW", 2)
+        new_course.save()
+        new_course.enroll(student_id)
+        Course.commit_update()
+        response = self.client.get(url, headers=dict(headers, **{"If-None-Match": etag}))
+        assert response.status_code == 200
+        assert {"course_title": f"{student_id}-NEW", "grade": None} in response.json["result"]["course_results"]
+
+        # Deleting an enrolled course drops it from the result
+        etag = response.headers["ETag"]
+        db.session.get(Course, new_course.id).delete()
+        response = self.client.get(url, headers=dict(headers, **{"If-None-Match": etag}))
+        assert response.status_code == 200
+        assert f"{student_id}-NEW" not in [item["course_title"] for item in response.json["result"]["course_results"]]
@@ -2,6 +2,7 @@ from unittest import TestCase
 
 from .. import create_app
 from ..database import db
+from ..models.identities import Identity
 from ..models.users import Admin
 
 
@@ -53,7 +54,8 @@ class TeacherTestCase(TestCase):
         headers = self.generate_auth_header()
         response = self.client.get("api/v0/teachers/", headers=headers)
         assert response.status_code == 200
-        assert isinstance(response.json, list)
+        assert isinstance(response.json["items"], list)
+        assert "next_cursor" in response.json
 
     def tests_on_single_teacher(self):
         headers = self.generate_auth_header()
@@ -74,3 +76,41 @@ class TeacherTestCase(TestCase):
         # Delete teacher:
         response = self.client.delete("api/v0/teachers/1", headers=headers)
         assert response.status_code == 204
+
+    def test_export_teachers(self):
+        headers = self.generate_auth_header()
+        response = self.client.get("api/v0/teachers/export?format=csv", headers=headers)
+        assert response.status_code == 200
+        assert response.data.decode().splitlines()[0] == "id,full_name,email_address,role"
+
+        response = self.client.get("api/v0/teachers/export?format=xml", headers=headers)
+        assert response.status_code == 400
+
+    def test_email_addresses_are_unique_across_users(self):
+        headers = self.generate_auth_header()
+        data = {"full_name": "Teacher Admin", "email_address": "testadmin@gmail.com"}
+        response = self.client.post("api/v0/teachers/", json=data, headers=headers)
+        assert response.status_code == 400
+        assert response.json["message"] == "User with email address: testadmin@gmail.com already exists"
+
+        data = {"full_name": "Teacher Three", "email_address": "teacherthree@gmail.com"}
+        response = self.client.post("api/v0/teachers/", json=data, headers=headers)
+        teacher_id = response.json["id"]
+        assert Identity.find("teacherthree@gmail.com").user_id == teacher_id
+
+        data = {"email_address": "testadmin@gmail.com"}
+        response = self.client.put(f"api/v0/teachers/{teacher_id}", json=data, headers=headers)
+        assert response.status_code == 400
+
+        data = {"email_address": "teacherfour@gmail.com"}
+        response = self.client.put(f"api/v0/teachers/{teacher_id}", json=data, headers=headers)
+        assert response.status_code == 200
+        assert Identity.find("teacherthree@gmail.com") is None
+        assert Identity.find("teacherfour@gmail.com").role == "STAFF"
+
+        login = {"email_address": "teacherfour@gmail.com", "password": "teacherpassword123"}
+        response = self.client.post("api/v0/auth/login", json=login)
+        assert response.status_code == 200
+
+        self.client.delete(f"api/v0/teachers/{teacher_id}", headers=headers)
+        assert Identity.find("teacherfour@gmail.com") is None
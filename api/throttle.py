@@ -0,0 +1,45 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class Throttle:
+    """
+    Token bucket rate limiter keyed by any string, e.g. an email address or IP.
+
+    Each key may make `burst` attempts at once, and gets `rate` more every
+    second up to `burst`. Only the `max_keys` most recently seen keys are
+    tracked; older keys start again with a full bucket. A `rate` of 0 turns
+    the throttle off.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def hit(self, key):
+        """
+        Take a token from the key's bucket. Returns 0 if one was available, or
+        else the number of seconds until there will be one.
+        """
+        if self.rate <= 0:
+            return 0
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = math.ceil((1 - tokens) / self.rate)
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
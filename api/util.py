@@ -1,19 +1,33 @@
+import base64
+import binascii
+import csv
+import hashlib
+import io
+import json
 import re
-from functools import wraps
+import sys
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache, wraps
 from http import HTTPStatus
 
+from flask import Response, request, stream_with_context
+from flask_restx import abort
 from pyisemail import is_email
 from pyisemail.diagnosis import ValidDiagnosis
+from sqlalchemy import and_, or_, tuple_
+from werkzeug.http import quote_etag
 
+from .database import db
+from .models.identities import Identity
 from .models.students import Student
 from .models.teachers import Teacher
+from .models.users import Admin
+from .serializers.marshalling import marshal, prepare_query
 
 from flask_jwt_extended import get_current_user, get_jwt, verify_jwt_in_request
 
 
-BLOCKLIST = set()
-
-
 def admin_required():
     """
     Decorator to allow only users with `ADMIN` role access
@@ -48,41 +62,281 @@ def staff_required():
     return wrapper
 
 
+def retry_later(status, message, retry_after):
+    return {"message": message}, status, {"Retry-After": str(retry_after)}
+
+
+def get_user_or_404(model, user_id):
+    """
+    Get a user by ID, reusing the current user instead of loading them again
+    """
+    current_user = get_current_user()
+    if isinstance(current_user, model) and current_user.id == user_id:
+        return current_user
+    return db.get_or_404(model, user_id)
+
+
+USER_MODELS = {"ADMIN": Admin, "STAFF": Teacher, "STUDENT": Student}
+
+
+def find_user_by_identity(key, roles=tuple(USER_MODELS)):
+    """
+    Get the user an email address or school ID belongs to, if they have one of `roles`
+    """
+    identity = Identity.find(key)
+    if identity is None or identity.role not in roles:
+        return None
+    return db.session.get(USER_MODELS[identity.role], identity.user_id)
+
+
+def email_in_use(email_address, user=None):
+    """
+    Check if an email address belongs to any user other than `user`
+    """
+    if not email_address:
+        return False
+    identity = Identity.find(email_address)
+    if identity is None:
+        return False
+    return user is None or (identity.role, identity.user_id) != (user.role, user.id)
+
+
 def is_student_or_admin(student_id):
     """
     Grant access to a student or an admin
     """
-    current_user = get_current_user()
     claims = get_jwt()
-    user_role = claims.get("role")
-    student = Student.query.get_or_404(student_id)
-    if student == current_user or user_role == "ADMIN":
+    if claims.get("role") == "ADMIN":
         return True
-    else:
-        return False
+    current_user = get_current_user()
+    return isinstance(current_user, Student) and current_user.id == student_id
 
 
 def is_teacher_or_admin(teacher_id):
     """
     Grant access to a teacher or an admin
     """
-    current_user = get_current_user()
     claims = get_jwt()
-    user_role = claims.get("role")
-    teacher = Teacher.query.get_or_404(teacher_id)
-    if teacher == current_user or user_role == "ADMIN":
+    if claims.get("role") == "ADMIN":
         return True
-    else:
-        return False
+    current_user = get_current_user()
+    return isinstance(current_user, Teacher) and current_user.id == teacher_id
+
+
+FIRST_SCHOOL_YEAR = 2023
+SCHOOL_ID_REGEX = re.compile(r"^ALT/[A-Z]+\d{1,6}/(\d{4})$")
 
 
 def is_valid_school_id(school_id):
-    school_id_regex = r'^ALT\/[A-Z]+(?:\d{6})\/(?:2023)$'
-    return re.match(school_id_regex, school_id) is not None
+    """
+    Check the format of a school ID and that its year is not in the future
+    """
+    match = SCHOOL_ID_REGEX.match(school_id)
+    if match is None:
+        return False
+    return FIRST_SCHOOL_YEAR <= int(match.group(1)) <= date.today().year
+
+
+# Plain dot-atom addresses with a dotted, alphabetic-TLD domain, which is
+# almost every address we see. Anything else gets pyisemail's full diagnosis.
+EMAIL_REGEX = re.compile(
+    r"^(?=[^@]{1,64}@)(?=.{1,254}\Z)"
+    r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+    r"@(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,63}\Z"
+)
 
 
 def is_valid_email(email):
+    """
+    Check an email address, returning True or the reason it is invalid
+    """
+    if not isinstance(email, str):
+        return "Email address must be a string"
+    if EMAIL_REGEX.match(email):
+        return True
+    return diagnose_email(email)
+
+
+@lru_cache(maxsize=4096)
+def diagnose_email(email):
     is_valid = is_email(email, diagnose=True)
     if isinstance(is_valid, ValidDiagnosis):
         return True
     return is_valid.message
+
+
+def validate_emails(emails):
+    """
+    Check many email addresses at once, returning True or the reason each is
+    invalid, keyed by address. Repeated addresses are only checked once.
+    """
+    return {email: is_valid_email(email) for email in set(emails)}
+
+
+def encode_cursor(values):
+    """
+    Encode the sort key values of the last item on a page into an opaque cursor
+    """
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, keys):
+    """
+    Decode a cursor into one value per sort key, each of the key column's type
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        values = None
+
+    if (
+        not isinstance(values, list)
+        or len(values) != len(keys)
+        or not all(is_cursor_value(value, key) for value, key in zip(values, keys))
+    ):
+        abort(400, message="Invalid cursor")
+    return values
+
+
+def is_cursor_value(value, key):
+    if value is None:
+        return True
+    if isinstance(value, bool):
+        return False
+    python_type = key.type.python_type
+    if python_type is int:
+        return isinstance(value, int)
+    if issubclass(python_type, (float, Decimal)):
+        return isinstance(value, (int, float))
+    return isinstance(value, str) and issubclass(python_type, str)
+
+
+def prefix_filter(column, prefix):
+    """
+    Match the values of `column` that start with `prefix`. A range comparison
+    is used instead of LIKE so that an index on the column can be used.
+    """
+    # U+10FFFF has no next character, so trailing ones are dropped and the
+    # character before them is incremented instead
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return column >= prefix
+    upper_bound = stem[:-1] + chr(ord(stem[-1]) + 1)
+    return (column >= prefix) & (column < upper_bound)
+
+
+def after_nullable_keys(keys, values):
+    """
+    Match the rows that sort after `values` when some of them are NULL, which
+    a row value comparison never matches. NULLs sort first, as in SQLite.
+    """
+    conditions = []
+    for i, (key, value) in enumerate(zip(keys, values)):
+        earlier_keys_equal = [
+            earlier.is_(None) if earlier_value is None else earlier == earlier_value
+            for earlier, earlier_value in zip(keys[:i], values[:i])
+        ]
+        after = key.is_not(None) if value is None else key > value
+        conditions.append(and_(*earlier_keys_equal, after))
+    return or_(*conditions)
+
+
+def paginate(query, args, keys):
+    """
+    Get a page of `query` using keyset pagination on the `keys` columns.
+    The last key must be unique (usually the primary key).
+    Returns the items on the page and the cursor of the next page, if any.
+    """
+    limit = args["limit"]
+    query = query.order_by(*keys)
+
+    if args.get("cursor"):
+        values = decode_cursor(args["cursor"], keys)
+        if None in values:
+            query = query.filter(after_nullable_keys(keys, values))
+        elif len(keys) == 1:
+            query = query.filter(keys[0] > values[0])
+        else:
+            query = query.filter(tuple_(*keys) > tuple_(*values))
+
+    items = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([getattr(items[-1], key.key) for key in keys])
+    return items, next_cursor
+
+
+def paginated_response(query, model, args, keys):
+    """
+    Marshal a page of `query`, or every item when the client opted in with `all`
+    """
+    query = prepare_query(query, model)
+    if args["all"]:
+        return marshal(query.order_by(*keys).all(), model)
+
+    items, next_cursor = paginate(query, args, keys)
+    return {"items": marshal(items, model), "next_cursor": next_cursor}
+
+
+def page_versions(query, args, keys, version):
+    """
+    The keys and `version` of every row on the page `paginated_response`
+    returns for the same arguments, and the cursor of the next page
+    """
+    query = query.with_entities(*keys, version)
+    if args["all"]:
+        return query.order_by(*keys).all(), None
+    return paginate(query, args, keys)
+
+
+def conditional_response(versions, build):
+    """
+    Answer a GET with a weak ETag made from `versions`, the version counters
+    of everything its body is built from. `build` is only called when the
+    client's If-None-Match does not have the ETag already; otherwise the
+    response is a 304 Not Modified with no body.
+    """
+    etag = hashlib.blake2b(repr(versions).encode(), digest_size=12).hexdigest()
+    headers = {"ETag": quote_etag(etag, weak=True)}
+    if request.if_none_match.contains_weak(etag):
+        return None, HTTPStatus.NOT_MODIFIED, headers
+    return build(), HTTPStatus.OK, headers
+
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def stream_export(query, model, export_format, filename):
+    """
+    Stream every row of `query` marshalled with `model` as NDJSON or CSV.
+    Rows are fetched from a server-side cursor in batches and written out one
+    at a time, so memory use does not grow with the size of the table.
+    """
+    fieldnames = list(model.keys())
+    query = prepare_query(query, model)
+
+    def generate_ndjson():
+        for obj in query.yield_per(EXPORT_BATCH_SIZE):
+            yield json.dumps(marshal(obj, model)) + "\n"
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+        writer.writeheader()
+        for obj in query.yield_per(EXPORT_BATCH_SIZE):
+            writer.writerow(marshal(obj, model))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    rows = generate_csv() if export_format == "csv" else generate_ndjson()
+    return Response(
+        stream_with_context(rows),
+        mimetype=EXPORT_MIMETYPES[export_format],
+        headers={"Content-Disposition": f"attachment; filename={filename}.{export_format}"},
+    )
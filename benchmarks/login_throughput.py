@@ -0,0 +1,109 @@
+"""
+Throughput benchmark for the login endpoint.
+
+Many clients log in at once, as students do when results are released, and
+the benchmark reports logins per second, latency and how many logins were
+shed with a 503 because the password hashing pool was saturated.
+
+Usage:
+    python -m benchmarks.login_throughput [--clients 16] [--workers 4] [--max-pending 64]
+        [--method pbkdf2:sha256:600000] [--duration 5]
+"""
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from api import create_app
+from api.models.students import Student
+from config import BaseConfig
+
+NUM_STUDENTS = 50
+PASSWORD = "password123"
+
+
+def make_config(database_path, method, workers, max_pending):
+    class BenchmarkConfig(BaseConfig):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{database_path}"
+        TOKEN_BLOCKLIST_SWEEP_INTERVAL = 0
+        PASSWORD_HASH_METHOD = method
+        PASSWORD_HASH_WORKERS = workers
+        PASSWORD_HASH_MAX_PENDING = max_pending
+        LOGIN_IDENTITY_RATE = 0
+        LOGIN_IP_RATE = 0
+
+    return BenchmarkConfig
+
+
+def seed(app):
+    with app.app_context():
+        password_hash = app.extensions["password_hasher"].generate(PASSWORD)
+        school_ids = []
+        for i in range(NUM_STUDENTS):
+            student = Student(f"Bench Student{i}", f"student{i}@example.com", password_hash=password_hash)
+            student.save()
+            school_ids.append(student.school_id)
+        return school_ids
+
+
+def client(app, school_ids, offset, stop, results):
+    test_client = app.test_client()
+    latencies, shed = [], 0
+    i = offset
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = test_client.post(
+            "api/v0/auth/login",
+            json={"school_id": school_ids[i % len(school_ids)], "password": PASSWORD},
+        )
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        elif response.status_code == 503:
+            shed += 1
+        i += 1
+    results.append((latencies, shed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--method", default=BaseConfig.PASSWORD_HASH_METHOD)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = make_config(Path(tmp) / "bench.sqlite3", args.method, args.workers, args.max_pending)
+        app = create_app(config)
+        school_ids = seed(app)
+
+        stop = threading.Event()
+        results = []
+        threads = [
+            threading.Thread(target=client, args=(app, school_ids, i, stop, results))
+            for i in range(args.clients)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+    shed = sum(client_shed for _, client_shed in results)
+    workers = app.extensions["password_hasher"].max_workers
+    print(f"clients={args.clients} workers={workers} max_pending={args.max_pending} method={args.method}")
+    print(f"logins/s:     {len(latencies) / args.duration:8.1f}")
+    print(f"shed (503):   {shed:8d}")
+    if latencies:
+        print(f"p50 latency:  {statistics.median(latencies) * 1000:8.1f} ms")
+        print(f"p95 latency:  {latencies[int(len(latencies) * 0.95)] * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Micro-benchmark for request payload validation.
+
+Times flask-restx's jsonschema validation against the compiled validators of
+the input models, on a valid payload for each endpoint that validates its
+input.
+
+Usage:
+    python -m benchmarks.payload_validation [--number 20000]
+"""
+import argparse
+import timeit
+
+from flask_restx import Model
+from jsonschema import RefResolver
+
+from api.serializers.auth import login_model, new_password_input
+from api.serializers.courses import batch_register_model, course_input_model, course_register_model
+from api.serializers.grades import grading_band_model, grading_scale_input, score_input
+from api.serializers.users import signup_model, user_input_model
+
+PAYLOADS = [
+    ("POST /auth/login", login_model, {"school_id": "ALT/JOHN000001/2026", "password": "password123"}),
+    ("POST /auth/change-password", new_password_input, {"new_password": "password1234"}),
+    ("POST /admin/signup", signup_model, {
+        "email_address": "admin@example.com", "full_name": "Ada Admin",
+        "password": "password123", "confirm_password": "password123",
+    }),
+    ("POST /students/", user_input_model, {"full_name": "John Doe", "email_address": "john@example.com"}),
+    ("POST /courses/", course_input_model, {
+        "title": "Python", "course_code": "PY101", "credit_unit": 3, "teacher_id": 1,
+    }),
+    ("POST /courses/enroll", course_register_model, {
+        "course_title": "Python", "school_id": "ALT/JOHN000001/2026",
+    }),
+    ("POST /courses/enroll/batch", batch_register_model, {
+        "course_title": "Python", "school_ids": [f"ALT/JOHN{i:06d}/2026" for i in range(50)],
+    }),
+    ("PUT /grade/<student>/<course>", score_input, {"score": 72.5}),
+    ("POST /grade/scales", grading_scale_input, {"bands": [
+        {"letter": "A", "min_score": 70}, {"letter": "B", "min_score": 50},
+        {"letter": "C", "min_score": 30}, {"letter": "D", "min_score": 0},
+    ]}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    resolver = RefResolver.from_schema(
+        {"definitions": {grading_band_model.name: grading_band_model.__schema__}}
+    )
+    print(f"{'endpoint':32} {'jsonschema':>12} {'compiled':>12} {'speedup':>8}")
+    for endpoint, model, payload in PAYLOADS:
+        before = timeit.timeit(lambda: Model.validate(model, payload, resolver), number=args.number)
+        after = timeit.timeit(lambda: model.validate(payload, resolver), number=args.number)
+        per_call = 1e6 / args.number
+        print(
+            f"{endpoint:32} {before * per_call:9.1f} us {after * per_call:9.1f} us "
+            f"{before / after:7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Concurrency benchmark for the student result endpoint.
+
+Measures how many `GET /students/<id>/result` requests per second the API
+serves on its own and while teachers keep re-grading students in the
+background. Since result reads no longer write the GPA back, read throughput
+should stay roughly level once graders join in.
+
+Usage:
+    python -m benchmarks.result_reads [--readers 4] [--graders 2] [--duration 5]
+"""
+import argparse
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from api import create_app
+from api.database import db
+from api.models.courses import Course
+from api.models.grades import Grade
+from api.models.students import Student
+from api.models.teachers import Teacher
+from api.models.users import Admin
+from config import BaseConfig
+
+NUM_STUDENTS = 20
+NUM_COURSES = 5
+PASSWORD = "password123"
+
+
+def make_config(database_path):
+    class BenchmarkConfig(BaseConfig):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{database_path}"
+
+    return BenchmarkConfig
+
+
+def seed(app):
+    with app.app_context():
+        Admin("Bench Admin", "benchadmin@example.com", PASSWORD).save()
+        students = []
+        for i in range(NUM_STUDENTS):
+            student = Student(f"Bench Student{i}", f"student{i}@example.com", PASSWORD)
+            student.save()
+            students.append(student)
+
+        for i in range(NUM_COURSES):
+            teacher = Teacher(f"Bench Teacher{i}", f"teacher{i}@example.com", PASSWORD)
+            teacher.save()
+            course = Course(f"Bench {i}", f"BN{i}", 2, teacher_id=teacher.id)
+            course.save()
+            course.students.extend(students)
+            course.commit_update()
+            for student in students:
+                grade = Grade(student_id=student.id, course_id=course.id, score=random.uniform(0, 100))
+                grade.allocate_letter_grade()
+                db.session.add(grade)
+            db.session.commit()
+
+
+def login(client, **credentials):
+    response = client.post("api/v0/auth/login", json=dict(credentials, password=PASSWORD))
+    return {"Authorization": f"Bearer {response.json['access_token']}"}
+
+
+def reader(app, headers, stop, counts):
+    client = app.test_client()
+    done = 0
+    while not stop.is_set():
+        student_id = random.randint(1, NUM_STUDENTS)
+        response = client.get(f"api/v0/students/{student_id}/result", headers=headers)
+        if response.status_code == 200:
+            done += 1
+    counts.append(done)
+
+
+def grader(app, teacher_number, stop, counts):
+    client = app.test_client()
+    headers = login(client, email_address=f"teacher{teacher_number}@example.com")
+    course_id = teacher_number + 1
+    done = 0
+    while not stop.is_set():
+        student_id = random.randint(1, NUM_STUDENTS)
+        response = client.put(
+            f"api/v0/grade/{student_id}/{course_id}",
+            json={"score": random.uniform(0, 100)},
+            headers=headers,
+        )
+        if response.status_code == 200:
+            done += 1
+    counts.append(done)
+
+
+def run(app, headers, readers, graders, duration):
+    stop = threading.Event()
+    read_counts, write_counts = [], []
+    threads = [
+        threading.Thread(target=reader, args=(app, headers, stop, read_counts))
+        for _ in range(readers)
+    ]
+    threads += [
+        threading.Thread(target=grader, args=(app, i % NUM_COURSES, stop, write_counts))
+        for i in range(graders)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(read_counts) / duration, sum(write_counts) / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--graders", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(Path(tmp) / "bench.sqlite3"))
+        seed(app)
+        headers = login(app.test_client(), email_address="benchadmin@example.com")
+
+        reads_alone, _ = run(app, headers, args.readers, 0, args.duration)
+        reads_mixed, writes_mixed = run(app, headers, args.readers, args.graders, args.duration)
+
+    print(f"readers={args.readers} graders={args.graders} duration={args.duration}s")
+    print(f"result reads/s, no graders:   {reads_alone:8.1f}")
+    print(f"result reads/s, with graders: {reads_mixed:8.1f}  ({reads_mixed / reads_alone:.0%})")
+    print(f"grade writes/s, with readers: {writes_mixed:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Mixed read/write benchmark for the SQLite engine settings.
+
+Runs the result read and re-grading workload of `benchmarks.result_reads`
+twice: once with SQLite's defaults (rollback journal, no busy timeout, default
+pool) and once with the tuned SQLITE_PRAGMAS and SQLALCHEMY_ENGINE_OPTIONS of
+the chosen stage, and reports successful reads and writes per second.
+
+Usage:
+    python -m benchmarks.sqlite_tuning [--stage Production] [--readers 4] [--graders 2] [--duration 5]
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+import config
+from api import create_app
+from benchmarks.result_reads import login, run, seed
+
+
+def make_config(database_path, stage, tuned):
+    class BenchmarkConfig(stage):
+        TESTING = True
+        DEBUG = False
+        SQLALCHEMY_ECHO = False
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{database_path}"
+        TOKEN_BLOCKLIST_SWEEP_INTERVAL = 0
+        LOGIN_IDENTITY_RATE = 0
+        LOGIN_IP_RATE = 0
+
+    if not tuned:
+        BenchmarkConfig.SQLITE_PRAGMAS = {}
+        BenchmarkConfig.SQLALCHEMY_ENGINE_OPTIONS = {}
+    return BenchmarkConfig
+
+
+def measure(stage, tuned, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(Path(tmp) / "bench.sqlite3", stage, tuned))
+        seed(app)
+        headers = login(app.test_client(), email_address="benchadmin@example.com")
+        return run(app, headers, args.readers, args.graders, args.duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stage", default="Production")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--graders", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+    stage = getattr(config, args.stage)
+
+    print(f"stage={args.stage} readers={args.readers} graders={args.graders} duration={args.duration}s")
+    for label, tuned in (("defaults", False), ("tuned", True)):
+        reads, writes = measure(stage, tuned, args)
+        print(f"{label:9} reads/s: {reads:8.1f}   writes/s: {writes:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,9 +13,55 @@ class BaseConfig:
 
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{BASE_DIR}/instance/db.sqlite3"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Applied to every new SQLite connection. WAL lets readers run alongside a
+    # writer, busy_timeout makes writers wait for the lock instead of failing
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "mmap_size": 128 * 1024 * 1024,
+        "cache_size": -32000,
+    }
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "secret-space")
     SECRET_KEY = os.environ.get("SECRET_KEY")
     JWT_ERROR_MESSAGE_KEY = "message"
+    # How many school ID numbers each worker reserves from the database at a time
+    SCHOOL_ID_BLOCK_SIZE = 100
+    # Seconds a worker may keep using a compiled grading scale edited by another worker
+    GRADING_SCALE_CACHE_TTL = 60
+    # Seconds to cache the identity of the user behind an access token across
+    # requests, 0 to turn off. A worker only drops its own copy on writes, so
+    # other workers may see an old email address or school ID for this long
+    USER_CACHE_TTL = 0
+    # Revoked tokens the in-process Bloom filter is sized for before it is rebuilt larger
+    TOKEN_BLOCKLIST_CAPACITY = 10000
+    # Seconds before a worker sees tokens revoked by another worker
+    TOKEN_BLOCKLIST_SYNC_INTERVAL = 5
+    # Seconds between sweeps that delete expired revoked tokens, 0 to turn off
+    TOKEN_BLOCKLIST_SWEEP_INTERVAL = 3600
+    # Hash method for new passwords; older hashes are upgraded when their owner logs in
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:600000"
+    # Threads hashing passwords (defaults to the CPU count) and hashes allowed to wait for them
+    PASSWORD_HASH_WORKERS = None
+    PASSWORD_HASH_MAX_PENDING = 64
+    # Login attempts per second and at once for each account and each client IP, 0 rate to turn off
+    LOGIN_IDENTITY_RATE = 0.1
+    LOGIN_IDENTITY_BURST = 5
+    LOGIN_IP_RATE = 5
+    LOGIN_IP_BURST = 50
+    # Queries logged as slow at this many milliseconds (0 to turn off) and the
+    # fraction of other queries logged as a sample
+    QUERY_SLOW_MS = 100
+    QUERY_SAMPLE_RATE = 0.0
+    # Times one statement may run in a request before it is logged as a likely N+1
+    QUERY_N_PLUS_ONE_THRESHOLD = 10
+    # Directory where each worker process writes its request metrics for /metrics
+    # to add up, or None to serve the metrics of the worker that is scraped
+    METRICS_DIRECTORY = os.environ.get("METRICS_DIRECTORY")
+    # Seconds between writes of a worker's metrics to the metrics directory
+    METRICS_FLUSH_INTERVAL = 5
+    # Bearer token scrapers must send to read /metrics, which is not served without one
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
 
 
 class Development(BaseConfig):
@@ -30,7 +76,11 @@ class Production(BaseConfig):
 
     DEBUG = False
     ENV = "production"
-    SQLALCHEMY_ECHO = True
+    QUERY_SAMPLE_RATE = 0.01
+    # Enough connections for waitress's request threads and the background sweeper
+    SQLALCHEMY_ENGINE_OPTIONS = {"pool_size": 8, "max_overflow": 4, "pool_timeout": 10}
+    SQLITE_PRAGMAS = dict(BaseConfig.SQLITE_PRAGMAS, mmap_size=256 * 1024 * 1024, cache_size=-64000)
+    USER_CACHE_TTL = 5
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=30)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=7)
 
@@ -40,3 +90,8 @@ class Test(BaseConfig):
     TESTING = True
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{BASE_DIR}/instance/test.db"
+    TOKEN_BLOCKLIST_SWEEP_INTERVAL = 0
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256"
+    LOGIN_IDENTITY_RATE = 0
+    LOGIN_IP_RATE = 0
+    METRICS_TOKEN = "test-metrics-token"
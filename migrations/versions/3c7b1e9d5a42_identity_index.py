@@ -0,0 +1,46 @@
+"""add identity index
+
+Revision ID: 3c7b1e9d5a42
+Revises: e6a2d9f41c73
+Create Date: 2026-10-18 16:21:37.508126
+
+Email addresses must be unique across the admin, teacher and student tables
+before upgrading, or the backfill fails on the identity primary key.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c7b1e9d5a42'
+down_revision = 'e6a2d9f41c73'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'identity',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('role', sa.String(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('identity', schema=None) as batch_op:
+        batch_op.create_index('ix_identity_role_user_id', ['role', 'user_id'], unique=False)
+
+    op.execute(
+        "INSERT INTO identity (key, role, user_id) "
+        "SELECT email_address, role, id FROM admin "
+        "UNION ALL SELECT email_address, role, id FROM teacher "
+        "UNION ALL SELECT email_address, role, id FROM student "
+        "UNION ALL SELECT school_id, role, id FROM student WHERE school_id IS NOT NULL"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('identity', schema=None) as batch_op:
+        batch_op.drop_index('ix_identity_role_user_id')
+
+    op.drop_table('identity')
@@ -0,0 +1,36 @@
+"""make (course_id, student_id) the primary key of enrollment
+
+Revision ID: 4f9e6a1c8b07
+Revises: d73b0c5e2f84
+Create Date: 2026-10-18 13:40:18.927351
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f9e6a1c8b07'
+down_revision = 'd73b0c5e2f84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Drop duplicate and incomplete enrolments before adding the primary key
+    op.execute(
+        "DELETE FROM enrollment WHERE course_id IS NULL OR student_id IS NULL "
+        "OR rowid NOT IN (SELECT min(rowid) FROM enrollment GROUP BY course_id, student_id)"
+    )
+
+    with op.batch_alter_table('enrollment', schema=None, recreate='always') as batch_op:
+        batch_op.alter_column('course_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('student_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_primary_key('pk_enrollment', ['course_id', 'student_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('enrollment', schema=None, recreate='always') as batch_op:
+        batch_op.drop_constraint('pk_enrollment', type_='primary')
+        batch_op.alter_column('student_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('course_id', existing_type=sa.Integer(), nullable=True)
@@ -0,0 +1,30 @@
+"""add running grade totals to student
+
+Revision ID: 5c1e8f3a9d21
+Revises: 232b1b8fc1bd
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e8f3a9d21'
+down_revision = '232b1b8fc1bd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('student', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_points', sa.Float(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('total_credit_units', sa.Integer(), nullable=False, server_default='0'))
+
+    # Existing totals are filled in by running `flask reconcile-gpa` after upgrading
+
+
+def downgrade():
+    with op.batch_alter_table('student', schema=None) as batch_op:
+        batch_op.drop_column('total_credit_units')
+        batch_op.drop_column('total_points')
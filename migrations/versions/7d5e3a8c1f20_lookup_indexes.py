@@ -0,0 +1,36 @@
+"""add enrollment and grade lookup indexes
+
+Revision ID: 7d5e3a8c1f20
+Revises: 3c7b1e9d5a42
+Create Date: 2026-10-18 19:42:05.913674
+
+enrollment.course_id and grades.student_id are already served by the leading
+column of their composite primary keys, course.teacher_id was indexed in
+9a4d2b7e61c3, and the unique email_address columns have implicit indexes.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d5e3a8c1f20'
+down_revision = '3c7b1e9d5a42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('enrollment', schema=None) as batch_op:
+        batch_op.create_index('ix_enrollment_student_id', ['student_id'], unique=False)
+
+    with op.batch_alter_table('grades', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_grades_course_id'), ['course_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('grades', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_grades_course_id'))
+
+    with op.batch_alter_table('enrollment', schema=None) as batch_op:
+        batch_op.drop_index('ix_enrollment_student_id')
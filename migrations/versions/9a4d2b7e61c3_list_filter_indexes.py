@@ -0,0 +1,32 @@
+"""index the columns used to filter collection endpoints
+
+Revision ID: 9a4d2b7e61c3
+Revises: 5c1e8f3a9d21
+Create Date: 2026-10-18 11:03:52.604719
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4d2b7e61c3'
+down_revision = '5c1e8f3a9d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('student', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_student_gpa'), ['gpa'], unique=False)
+
+    with op.batch_alter_table('course', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_course_teacher_id'), ['teacher_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('course', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_course_teacher_id'))
+
+    with op.batch_alter_table('student', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_student_gpa'))
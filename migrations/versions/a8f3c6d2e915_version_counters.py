@@ -0,0 +1,28 @@
+"""add version counters to student, course and grades
+
+Revision ID: a8f3c6d2e915
+Revises: 7d5e3a8c1f20
+Create Date: 2026-10-18 20:03:27.451809
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8f3c6d2e915'
+down_revision = '7d5e3a8c1f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('student', 'course', 'grades'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    for table in ('grades', 'course', 'student'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('version')
@@ -0,0 +1,32 @@
+"""add grading scales
+
+Revision ID: b81f4c2d9e56
+Revises: 4f9e6a1c8b07
+Create Date: 2026-10-18 15:02:44.710385
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f4c2d9e56'
+down_revision = '4f9e6a1c8b07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'grading_scale',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('course_id', sa.Integer(), nullable=True),
+        sa.Column('bands', sa.JSON(), nullable=False),
+        sa.ForeignKeyConstraint(['course_id'], ['course.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('course_id')
+    )
+
+
+def downgrade():
+    op.drop_table('grading_scale')
@@ -0,0 +1,29 @@
+"""add the school ID sequence table
+
+Revision ID: d73b0c5e2f84
+Revises: 9a4d2b7e61c3
+Create Date: 2026-10-18 12:27:05.331962
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd73b0c5e2f84'
+down_revision = '9a4d2b7e61c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'school_id_sequence',
+        sa.Column('year', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('next_value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('year')
+    )
+
+
+def downgrade():
+    op.drop_table('school_id_sequence')
@@ -0,0 +1,33 @@
+"""stop reusing revoked token ids
+
+Revision ID: f2b8d4a6c913
+Revises: a8f3c6d2e915
+Create Date: 2026-10-18 21:05:44.310527
+
+Workers sync revoked tokens by id, so ids freed by pruning expired tokens
+must never be handed out again.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d4a6c913'
+down_revision = 'a8f3c6d2e915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table(
+        'revoked_token', schema=None, recreate='always', table_kwargs={'sqlite_autoincrement': True}
+    ) as batch_op:
+        pass
+
+
+def downgrade():
+    with op.batch_alter_table(
+        'revoked_token', schema=None, recreate='always', table_kwargs={'sqlite_autoincrement': False}
+    ) as batch_op:
+        pass